@@ -62,6 +62,14 @@ class App extends Component {
 
     let csrfToken = document.querySelector("[name=csrfmiddlewaretoken]").value;
 
+    // Retries of the same checkout reuse the key, so the order is not placed twice.
+    // A changed cart or contacts make a new order and get a new key
+    let body = JSON.stringify(data);
+    if (!this.checkoutKey || this.checkoutBody !== body){
+      this.checkoutKey = Date.now().toString(36) + Math.random().toString(36).slice(2);
+      this.checkoutBody = body;
+    }
+
     try {
       let response = await fetch(url, {
         method: 'post',
@@ -69,8 +77,9 @@ class App extends Component {
           'Accept': 'application/json',
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken,
+          'Idempotency-Key': this.checkoutKey,
         },
-        body: JSON.stringify(data),
+        body: body,
       });
 
       if (!response.ok){
@@ -78,6 +87,7 @@ class App extends Component {
         return;
       }
       let responseData = await response.json();
+      this.checkoutKey = null;
 
       this.setState({
         cart: [],
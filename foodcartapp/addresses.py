@@ -0,0 +1,62 @@
+import re
+
+from django.db.models import Case, IntegerField, Value, When
+
+
+def normalize_address(address):
+    address = address.casefold().replace('ё', 'е')
+    address = re.sub(r'[,.;]', ' ', address)
+    return ' '.join(address.split())
+
+
+def merge_duplicate_places(Place, Order, Restaurant, batch_size=500):
+    """Give every place its normalized address key, merging places with equal keys.
+
+    Of the places sharing a key the one with coordinates and the lowest id
+    is kept, orders and restaurants of the others are moved to it.
+    Models are passed in so that migrations can use their historical versions.
+    Returns a {duplicate place id: kept place id} dict.
+    """
+    keepers = {}
+    merged = {}
+    changed_keys = {}
+    places = Place.objects.order_by('id').values_list('id', 'address', 'address_key', 'lat', 'lng')
+    for place_id, address, address_key, lat, lng in places.iterator():
+        key = normalize_address(address)
+        has_coords = lat is not None and lng is not None
+        keeper = keepers.get(key)
+        if keeper is None or has_coords and not keeper[1]:
+            if keeper is not None:
+                merged[keeper[0]] = place_id
+                changed_keys.pop(keeper[0], None)
+            keepers[key] = (place_id, has_coords)
+            if address_key != key:
+                changed_keys[place_id] = key
+        else:
+            merged[place_id] = keeper[0]
+    merged = {duplicate_id: resolve_keeper(merged, keeper_id) for duplicate_id, keeper_id in merged.items()}
+
+    duplicate_ids = list(merged)
+    for start in range(0, len(duplicate_ids), batch_size):
+        batch = duplicate_ids[start:start + batch_size]
+        new_place = Case(
+            *[When(place_id=duplicate_id, then=Value(merged[duplicate_id])) for duplicate_id in batch],
+            output_field=IntegerField(),
+            )
+        Order.objects.filter(place_id__in=batch).update(place_id=new_place)
+        Restaurant.objects.filter(place_id__in=batch).update(place_id=new_place)
+        Place.objects.filter(id__in=batch).delete()
+
+    # Keys move in two steps, so that a key freed by one place can be taken by another
+    changed = [Place(id=place_id, address_key=f'~{place_id}') for place_id in changed_keys]
+    Place.objects.bulk_update(changed, ['address_key'], batch_size=batch_size)
+    for place in changed:
+        place.address_key = changed_keys[place.id]
+    Place.objects.bulk_update(changed, ['address_key'], batch_size=batch_size)
+    return merged
+
+
+def resolve_keeper(merged, place_id):
+    while place_id in merged:
+        place_id = merged[place_id]
+    return place_id
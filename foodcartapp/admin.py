@@ -1,13 +1,23 @@
+import logging
+
 import requests
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet
 from django.http import HttpResponseRedirect
 from django.shortcuts import reverse
 from django.templatetags.static import static
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from environs import Env
 
-from .fetch_coordinates import fetch_coordinates
-from .models import Product, Order, OrderDetails, Place
+from .addresses import normalize_address
+from .geocache import geocode_place
+from .models import Product, Order, OrderDetails, Place, GeocodingTask
+from .order_distances import refresh_place_distances, refresh_restaurant_distances, store_order_distances
+from .paginators import EstimatedCountPaginator
 from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
@@ -15,54 +25,162 @@ from .models import RestaurantMenuItem
 env = Env()
 env.read_env()
 
+logger = logging.getLogger(__name__)
+
 
-class RestaurantMenuItemInline(admin.TabularInline):
+def geocode_or_warn(model_admin, request, place):
+    """Geocode the place, warn the manager and return False if the geocoder is unavailable."""
+    try:
+        geocode_place(env.str('GEO_API_KEY'), place)
+    except requests.exceptions.RequestException:
+        logger.exception('Не удалось получить координаты адреса %s', place.address)
+        model_admin.message_user(
+            request,
+            f'Геокодер недоступен, координаты адреса «{place.address}» не обновлены',
+            messages.WARNING,
+            )
+        return False
+    return True
+
+
+def attach_place(model_admin, request, obj):
+    """Point obj.place at the place of obj.address, return whether the place has changed.
+
+    Nothing happens while the address stays the same up to normalization,
+    so edits of other fields never reach the geocoder. Known places are
+    reused, only places without coordinates are geocoded.
+    """
+    address_key = normalize_address(obj.address)
+    if obj.place and obj.place.address_key == address_key:
+        return False
+    place, is_created = Place.objects.get_or_create(address_key=address_key, defaults={'address': obj.address})
+    if (place.lat is None or place.lng is None) and geocode_or_warn(model_admin, request, place):
+        place.save(update_fields=['lat', 'lng', 'geocoded_at'])
+    obj.place = place
+    return True
+
+
+def refresh_product_price(form):
+    """Price an order line anew if its product or quantity was changed in the form."""
+    if {'product', 'quantity'} & set(form.changed_data) and not form.cleaned_data.get('DELETE'):
+        detail = form.instance
+        detail.product_price = detail.product.price * detail.quantity
+
+
+class PrefetchedAutocompleteSelect(AutocompleteSelect):
+    """Autocomplete select that takes its selected object from the formset instead of querying it."""
+    selected_objects = None
+
+    def optgroups(self, name, value, attr=None):
+        if self.selected_objects is None:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        selected_choices = {str(v) for v in value if str(v) not in self.choices.field.empty_values}
+        for pk in selected_choices:
+            obj = self.selected_objects.get(pk)
+            if obj is not None:
+                label = self.choices.field.label_from_instance(obj)
+                options.append(self.create_option(name, obj.pk, label, selected_choices, len(options)))
+                break
+        return [(None, options, 0)]
+
+
+class PrefetchedAutocompleteFormSet(BaseInlineFormSet):
+    """Inline formset that loads the selected objects of autocomplete fields with one query per field."""
+
+    @cached_property
+    def forms(self):
+        forms = super().forms
+        if not forms:
+            return forms
+        for field_name, field in forms[0].fields.items():
+            if not isinstance(getattr(field.widget, 'widget', field.widget), PrefetchedAutocompleteSelect):
+                continue
+            values = (form[field_name].value() for form in forms)
+            ids = {value for value in values if value not in field.empty_values}
+            selected_objects = {str(pk): obj for pk, obj in field.queryset.in_bulk(ids).items()}
+            for form in forms:
+                widget = form.fields[field_name].widget
+                getattr(widget, 'widget', widget).selected_objects = selected_objects
+        return forms
+
+
+class PrefixAutocompleteMixin:
+    """Match the autocomplete term as a prefix of `autocomplete_prefix_fields`.
+
+    Autocomplete asks on every keystroke, and a prefix lookup can use an index
+    on the field. The changelist keeps the usual substring search.
+    """
+    autocomplete_prefix_fields = []
+
+    def is_autocomplete_request(self, request):
+        opts = self.model._meta
+        url_name = f'{self.admin_site.name}:{opts.app_label}_{opts.model_name}_autocomplete'
+        return request.path == reverse(url_name)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not self.is_autocomplete_request(request):
+            return super().get_search_results(request, queryset, search_term)
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(self.get_prefix_filter(search_term)), False
+
+    def get_prefix_filter(self, search_term):
+        prefix_filter = Q()
+        for field_name in self.autocomplete_prefix_fields:
+            prefix_filter |= Q(**{f'{field_name}__istartswith': search_term})
+        return prefix_filter
+
+
+class AutocompleteInline(admin.TabularInline):
+    formset = PrefetchedAutocompleteFormSet
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = PrefetchedAutocompleteSelect(db_field.remote_field, self.admin_site,
+                                                            using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class RestaurantMenuItemInline(AutocompleteInline):
     model = RestaurantMenuItem
     extra = 0
+    autocomplete_fields = ['restaurant', 'product']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('restaurant', 'product')
 
 
 @admin.register(Restaurant)
-class RestaurantAdmin(admin.ModelAdmin):
+class RestaurantAdmin(PrefixAutocompleteMixin, admin.ModelAdmin):
     search_fields = [
         'name',
         'address',
         'contact_phone',
         ]
+    autocomplete_prefix_fields = ['name']
     list_display = [
         'name',
         'address',
         'contact_phone',
         ]
+    raw_id_fields = ['place']
     inlines = [
         RestaurantMenuItemInline
         ]
 
     def save_model(self, request, obj, form, change):
-        apikey = env.str('GEO_API_KEY')
-        try:
-            lng, lat = fetch_coordinates(apikey, obj.address)
-        except requests.exceptions.RequestException as e:
-            print(e)
-
-        if obj.place:
-            address = obj.place.address
-        else:
-            address = obj.address
-        place, is_created = Place.objects.get_or_create(address=address,
-                                                        defaults={'lat': lat, 'lng': lng})
-        if not is_created:
-            place = obj.place
-            place.address = obj.address
-            place.lat = lat
-            place.lng = lng
-            place.save()
-        else:
-            obj.place = place
+        place_changed = attach_place(self, request, obj)
         super().save_model(request, obj, form, change)
+        if place_changed:
+            refresh_restaurant_distances([obj.id])
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(PrefixAutocompleteMixin, admin.ModelAdmin):
     list_display = [
         'get_image_list_preview',
         'name',
@@ -81,6 +199,7 @@ class ProductAdmin(admin.ModelAdmin):
         'name',
         'category__name',
         ]
+    autocomplete_prefix_fields = ['name']
 
     inlines = [
         RestaurantMenuItemInline
@@ -117,6 +236,10 @@ class ProductAdmin(admin.ModelAdmin):
             )
             }
 
+    def get_prefix_filter(self, search_term):
+        categories = ProductCategory.objects.filter(name__istartswith=search_term)
+        return super().get_prefix_filter(search_term) | Q(category__in=categories)
+
     def get_image_preview(self, obj):
         if not obj.image:
             return 'выберите картинку'
@@ -139,23 +262,38 @@ class ProductAdmin(admin.ModelAdmin):
     pass
 
 
-class DetailsInline(admin.TabularInline):
+class DetailsInline(AutocompleteInline):
     model = OrderDetails
+    autocomplete_fields = ['product']
     readonly_fields = ['product_price']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('order')
+
 
 @admin.register(OrderDetails)
 class OrderDetailsAdmin(admin.ModelAdmin):
     list_display = ('product', 'quantity', 'order')
+    list_select_related = ('product', 'order')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = ['product_price']
 
+    def save_model(self, request, obj, form, change):
+        refresh_product_price(form)
+        super().save_model(request, obj, form, change)
+
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    search_fields = ["firstname__startswith"]
+    # Prefix lookups are case sensitive, so that they can use the indexes on these fields
+    search_fields = ['firstname__startswith', 'lastname__startswith', 'phonenumber__startswith']
     list_filter = ['order_status']
-    list_display = ['full_name', 'address', 'phonenumber']
-    readonly_fields = ('registered_at',)
+    list_display = ['full_name', 'address', 'phonenumber', 'total_cost']
+    readonly_fields = ('registered_at', 'total_cost')
+    raw_id_fields = ['place']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [
         DetailsInline
         ]
@@ -167,43 +305,44 @@ class OrderAdmin(admin.ModelAdmin):
         else:
             return res
 
-    def save_model(self, request, obj, form, change):
-        apikey = env.str('GEO_API_KEY')
-        try:
-            lng, lat = fetch_coordinates(apikey, obj.address)
-        except requests.exceptions.RequestException as e:
-            print(e)
-
-        if obj.place:
-            address = obj.place.address
-        else:
-            address = obj.address
-        place, is_created = Place.objects.get_or_create(address=address,
-                                                        defaults={'lat': lat, 'lng': lng})
-        if not is_created:
-            place = obj.place
-            place.address = obj.address
-            place.lat = lat
-            place.lng = lng
-            place.save()
+    def save_formset(self, request, form, formset, change):
+        for details_form in formset.forms:
+            refresh_product_price(details_form)
+        super().save_formset(request, form, formset, change)
 
-        else:
-            obj.place = place
+    def save_model(self, request, obj, form, change):
+        place_changed = attach_place(self, request, obj)
         super().save_model(request, obj, form, change)
+        if place_changed:
+            store_order_distances([obj])
+
+
+class PlaceAdminForm(forms.ModelForm):
+    def clean_address(self):
+        address = self.cleaned_data['address']
+        duplicates = Place.objects.filter(address_key=normalize_address(address)).exclude(id=self.instance.id)
+        if duplicates.exists():
+            raise forms.ValidationError('Место с таким адресом уже есть')
+        return address
 
 
 @admin.register(Place)
 class PlaceAdmin(admin.ModelAdmin):
-    list_display = ['address', 'lat', 'lng']
-    readonly_fields = ['created_at']
+    list_display = ['address', 'lat', 'lng', 'geocoded_at']
+    readonly_fields = ['created_at', 'geocoded_at']
+
+    form = PlaceAdminForm
 
     def save_model(self, request, obj, form, change):
-        apikey = env.str('GEO_API_KEY')
-        try:
-            lng, lat = fetch_coordinates(apikey=apikey, place=obj.address)
-            obj.lng = lng
-            obj.lat = lat
-
-        except requests.exceptions.RequestException as e:
-            print(e)
-        super(PlaceAdmin, self).save_model(request, obj, form, change)
+        if not change or normalize_address(obj.address) != obj.address_key:
+            geocode_or_warn(self, request, obj)
+        super().save_model(request, obj, form, change)
+        if not change or {'address', 'lat', 'lng'} & set(form.changed_data):
+            refresh_place_distances([obj.id])
+
+
+@admin.register(GeocodingTask)
+class GeocodingTaskAdmin(admin.ModelAdmin):
+    list_display = ['address', 'status', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['status']
+    readonly_fields = ['order', 'created_at']
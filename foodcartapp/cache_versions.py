@@ -0,0 +1,37 @@
+import threading
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+def get_version(name):
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    cache.set(f'version:{name}', uuid4().hex, None)
+
+
+class VersionedValue:
+    """Per-process value rebuilt whenever its version is bumped anywhere."""
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+        self._value = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = get_version(self.name)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._value = self.build()
+                    self._version = version
+        return self._value
@@ -0,0 +1,115 @@
+import gzip
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .cache_versions import get_version
+from .models import Product
+
+CHUNK_SIZE = 16 * 1024
+
+
+def iter_products():
+    image_storage = Product._meta.get_field('image').storage
+    products = (
+        Product.objects
+        .available()
+        .values('id', 'name', 'price', 'special_status', 'description', 'category_id', 'category__name', 'image')
+        .order_by('id')
+        )
+    for product in products.iterator():
+        category = None
+        if product['category_id']:
+            category = {
+                'id': product['category_id'],
+                'name': product['category__name'],
+                }
+        yield {
+            'id': product['id'],
+            'name': product['name'],
+            'price': product['price'],
+            'special_status': product['special_status'],
+            'description': product['description'],
+            'category': category,
+            'image': image_storage.url(product['image']),
+            'restaurant': {
+                'id': product['id'],
+                'name': product['name'],
+                }
+            }
+
+
+def iter_catalog_json(pretty=False):
+    """Yield the catalog as a JSON array in chunks of about CHUNK_SIZE bytes."""
+    if pretty:
+        encoder = DjangoJSONEncoder(ensure_ascii=False, indent=4)
+        opening, separator, closing = '[\n', ',\n', '\n]'
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        opening, separator, closing = '[', ',', ']'
+
+    buffer = [opening]
+    buffered = len(opening)
+    for index, product in enumerate(iter_products()):
+        item = encoder.encode(product)
+        if index:
+            item = separator + item
+        buffer.append(item)
+        buffered += len(item)
+        if buffered >= CHUNK_SIZE:
+            yield ''.join(buffer).encode()
+            buffer = []
+            buffered = 0
+    buffer.append(closing)
+    yield ''.join(buffer).encode()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def get_catalog_meta():
+    """Return the ETag and Last-Modified of the current catalog version.
+
+    Signals bump the catalog version whenever products, categories or
+    restaurant menus change, so both are known without touching the database.
+    """
+    version = get_version('catalog')
+    key = f'catalog:{version}:meta'
+    meta = cache.get(key)
+    if meta is None:
+        cache.add(key, {
+            'version': version,
+            'etag': version,
+            'last_modified': timezone.now().replace(microsecond=0),
+            }, settings.CATALOG_CACHE_TTL)
+        meta = cache.get(key)
+    return meta
+
+
+def get_cached_catalog(version, compressed=False):
+    body = cache.get(f'catalog:{version}:body')
+    if body is None or not compressed:
+        return body
+    key = f'catalog:{version}:gzip'
+    compressed_body = cache.get(key)
+    if compressed_body is None:
+        compressed_body = gzip.compress(body)
+        cache.set(key, compressed_body, settings.CATALOG_CACHE_TTL)
+    return compressed_body
+
+
+def iter_and_cache_catalog(version):
+    chunks = []
+    for chunk in iter_catalog_json():
+        chunks.append(chunk)
+        yield chunk
+    cache.set(f'catalog:{version}:body', b''.join(chunks), settings.CATALOG_CACHE_TTL)
@@ -0,0 +1,82 @@
+import numpy as np
+from geopy import distance
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_coords_array(places):
+    coords = np.full((len(places), 2), np.nan)
+    for index, place in enumerate(places):
+        if place is not None and place.lat is not None and place.lng is not None:
+            coords[index] = (float(place.lat), float(place.lng))
+    return coords
+
+
+def haversine_matrix(from_coords, to_coords):
+    """Return a len(from_coords) x len(to_coords) matrix of distances in km.
+
+    Rows or columns with unknown coordinates (NaN) come out as NaN.
+    """
+    from_lat, from_lng = np.radians(from_coords).T[:, :, np.newaxis]
+    to_lat, to_lng = np.radians(to_coords).T[:, np.newaxis, :]
+    a = (np.sin((to_lat - from_lat) / 2) ** 2
+         + np.cos(from_lat) * np.cos(to_lat) * np.sin((to_lng - from_lng) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class DistanceEngine:
+    """Distances from many places to a fixed set of restaurants at once.
+
+    Restaurant coordinates are loaded once, the whole places x restaurants
+    matrix is computed by haversine. With `exact_top_k` the nearest k
+    restaurants of every place are re-measured by geodesic distance.
+    """
+
+    def __init__(self, restaurants, exact_top_k=0):
+        self.restaurants = [restaurant for restaurant in restaurants if restaurant.place_id]
+        self.coords = to_coords_array([restaurant.place for restaurant in self.restaurants])
+        self.exact_top_k = exact_top_k
+
+    def matrix(self, places):
+        return haversine_matrix(to_coords_array(places), self.coords)
+
+    def rank(self, places, top_k=None):
+        """Return, for every place, a list of (restaurant, km) sorted by distance.
+
+        Places without coordinates get None instead of a list.
+        """
+        places = list(places)
+        place_coords = to_coords_array(places)
+        located = ~np.isnan(place_coords).any(axis=1)
+        if not self.restaurants:
+            return [[] if is_located else None for is_located in located]
+        distances = haversine_matrix(place_coords, self.coords)
+        rankings = []
+        for place, is_located, row in zip(places, located, distances):
+            if not is_located:
+                rankings.append(None)
+                continue
+            order = np.argsort(row, kind='stable')
+            order = order[~np.isnan(row[order])][:top_k]
+            ranking = [(self.restaurants[index], float(row[index])) for index in order]
+            if self.exact_top_k:
+                ranking = self._refine(place, ranking)
+            rankings.append(ranking)
+        return rankings
+
+    def _refine(self, place, ranking):
+        head, tail = ranking[:self.exact_top_k], ranking[self.exact_top_k:]
+        head = [
+            (restaurant, distance.distance(place.get_coords(), restaurant.place.get_coords()).km)
+            for restaurant, km in head
+            ]
+        head.sort(key=lambda item: item[1])
+        return head + tail
+
+
+def format_ranking(ranking):
+    if ranking is None:
+        return ['No Geo API data']
+    if not ranking:
+        return ['No suitable restaurants']
+    return [f'{restaurant.name} - {round(km, 3)} km' for restaurant, km in ranking]
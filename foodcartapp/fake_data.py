@@ -0,0 +1,182 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .addresses import normalize_address
+from .cache_versions import bump_version
+from .models import (Order, OrderDetails, OrderRestaurantDistance, Place, Product, ProductCategory, Restaurant,
+                     RestaurantMenuItem)
+from .spatial import get_restaurant_index
+
+ALMATY_BOUNDS = (43.18, 76.80, 43.32, 77.05)
+
+
+def get_next_id(model):
+    return (model.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+
+class FakeDataGenerator:
+    """Reproducible bulk data for load tests and benchmarks.
+
+    Primary keys are assigned up front, so related rows can be built without
+    reading anything back from the database. The big tables are written as
+    plain tuples with executemany, skipping model instances altogether.
+    """
+
+    def __init__(self, seed=0, bounds=ALMATY_BOUNDS, batch_size=5000):
+        self.rng = random.Random(seed)
+        self.bounds = bounds
+        self.batch_size = batch_size
+        self.phonenumbers = [f'+7705{number:07d}' for number in range(100)]
+        self.created = {}
+
+    def random_coords(self):
+        min_lat, min_lng, max_lat, max_lng = self.bounds
+        return (
+            Decimal(self.rng.uniform(min_lat, max_lat)).quantize(Decimal('0.000001')),
+            Decimal(self.rng.uniform(min_lng, max_lng)).quantize(Decimal('0.000001')),
+            )
+
+    def count_created(self, model, count):
+        self.created[model.__name__] = self.created.get(model.__name__, 0) + count
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.count_created(model, len(objects))
+
+    def insert_rows(self, model, field_names, rows):
+        quote_name = connection.ops.quote_name
+        columns = [model._meta.get_field(field_name).column for field_name in field_names]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote_name(model._meta.db_table),
+            ', '.join(quote_name(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+            )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start:start + self.batch_size])
+        self.count_created(model, len(rows))
+
+    def create_places(self, prefix, count):
+        first_id = get_next_id(Place)
+        created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        places = []
+        for place_id in range(first_id, first_id + count):
+            lat, lng = self.random_coords()
+            address = f'{prefix}, {place_id}'
+            places.append((place_id, address, normalize_address(address), lat, lng, created_at, created_at))
+        self.insert_rows(Place, ['id', 'address', 'address_key', 'lat', 'lng', 'created_at', 'geocoded_at'], places)
+        return places
+
+    def create_catalog(self, categories_count, products_count):
+        first_id = get_next_id(ProductCategory)
+        categories = [
+            ProductCategory(id=first_id + number, name=f'Категория {first_id + number}')
+            for number in range(categories_count)
+            ]
+        self.bulk_create(ProductCategory, categories)
+
+        first_id = get_next_id(Product)
+        products = [
+            Product(
+                id=first_id + number,
+                name=f'Блюдо {first_id + number}',
+                category=self.rng.choice(categories),
+                price=Decimal(self.rng.randint(100, 3000)),
+                image=f'product_{first_id + number}.jpg',
+                description='Описание блюда',
+                special_status=self.rng.random() < 0.05,
+                )
+            for number in range(products_count)
+            ]
+        self.bulk_create(Product, products)
+        return products
+
+    def create_restaurants(self, count):
+        first_id = get_next_id(Restaurant)
+        restaurants = [
+            Restaurant(id=first_id + number, name=f'Ресторан {first_id + number}', address=address,
+                       contact_phone='+77055197334', place_id=place_id)
+            for number, (place_id, address, *coords) in enumerate(self.create_places('Ресторан', count))
+            ]
+        self.bulk_create(Restaurant, restaurants)
+        return restaurants
+
+    def create_menu(self, restaurants, products, density, availability=0.9):
+        menu_items = [
+            (restaurant.id, product.id, self.rng.random() < availability)
+            for restaurant in restaurants
+            for product in products
+            if self.rng.random() < density
+            ]
+        self.insert_rows(RestaurantMenuItem, ['restaurant', 'product', 'availability'], menu_items)
+
+    def create_orders(self, count, products, max_lines=5, days=30, distances=True, progress=None):
+        now = timezone.now()
+        if distances:
+            bump_version('restaurants')
+            restaurant_index = get_restaurant_index()
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        modified_at = adapt_datetime(now)
+        statuses = [status for status, title in Order.STATUS]
+        payment_methods = [method for method, title in Order.PAYMENT_METHOD]
+        prices = [(product.id, product.price) for product in products]
+        first_order_id = get_next_id(Order)
+        next_details_id = get_next_id(OrderDetails)
+
+        for batch_start in range(0, count, self.batch_size):
+            batch_count = min(self.batch_size, count - batch_start)
+            places = self.create_places('Клиент', batch_count)
+            orders = []
+            details = []
+            for number, (place_id, address, *coords) in enumerate(places):
+                order_id = first_order_id + batch_start + number
+                total_cost = 0
+                for product_id, price in self.rng.sample(prices, self.rng.randint(1, min(max_lines, len(prices)))):
+                    quantity = self.rng.randint(1, 3)
+                    product_price = price * quantity
+                    total_cost += product_price
+                    details.append((next_details_id, order_id, product_id, quantity, product_price))
+                    next_details_id += 1
+                registered_at = now - timedelta(seconds=self.rng.randint(0, days * 24 * 60 * 60))
+                orders.append((
+                    order_id, 'Иван', f'Иванов {order_id}', address, self.rng.choice(self.phonenumbers),
+                    adapt_datetime(registered_at), self.rng.choice(statuses), self.rng.choice(payment_methods),
+                    '', place_id, total_cost, modified_at, '',
+                    ))
+            self.insert_rows(Order, [
+                'id', 'firstname', 'lastname', 'address', 'phonenumber', 'registered_at', 'order_status',
+                'payment_method', 'comment', 'place', 'total_cost', 'modified_at', 'idempotency_fingerprint',
+                ], orders)
+            self.insert_rows(OrderDetails, ['id', 'order', 'product', 'quantity', 'product_price'], details)
+            if distances:
+                order_places = [
+                    Place(lat=lat, lng=lng)
+                    for place_id, address, address_key, lat, lng, created_at, geocoded_at in places
+                    ]
+                rankings = restaurant_index.rank(
+                    order_places,
+                    top_k=settings.ORDER_DISTANCES_COUNT,
+                    radius_km=settings.NEAREST_RESTAURANTS_RADIUS_KM or None,
+                    )
+                self.insert_rows(OrderRestaurantDistance, ['order', 'restaurant', 'distance_km'], [
+                    (order[0], restaurant.id, km)
+                    for order, ranking in zip(orders, rankings)
+                    for restaurant, km in ranking
+                    ])
+            if progress:
+                progress(batch_start + batch_count)
+
+    def finish(self):
+        models = [Place, ProductCategory, Product, Restaurant, Order, OrderDetails]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+        for name in ('restaurants', 'menu', 'catalog'):
+            bump_version(name)
@@ -1,12 +1,119 @@
+import random
+import threading
+import time
+
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import track_geocoder_call
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError)
+
+
+class GeocoderUnavailable(requests.exceptions.RequestException):
+    """The circuit breaker is open, the geocoder is not called at all."""
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after `failure_threshold` failures in a row.
+
+    After `reset_timeout` seconds one trial call is let through: success
+    closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_progress or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class GeocoderClient:
+    """Yandex geocoder client sharing one pool of keep-alive connections.
+
+    The pool blocks, so at most `pool_size` requests go to the geocoder at
+    once, the others wait for a free connection.
+
+    Connection errors, timeouts and 429/5xx answers are retried a bounded
+    number of times with jittered exponential backoff and counted by the
+    circuit breaker.
+    """
+
+    base_url = 'https://geocode-maps.yandex.ru/1.x'
+
+    def __init__(self, timeout, retries, backoff, pool_size, breaker):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=True)
+        self.session.mount('https://', adapter)
+
+    def get(self, params):
+        if not self.breaker.allow():
+            raise GeocoderUnavailable('Геокодер недоступен, повторите запрос позже')
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                if not isinstance(e, TRANSIENT_ERRORS) or attempt == self.retries:
+                    self.breaker.record_failure()
+                    raise
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        self.breaker.record_success()
+        response.raise_for_status()
+        return response.json()
+
+
+geocoder_client = GeocoderClient(
+    timeout=(settings.GEOCODER_CONNECT_TIMEOUT, settings.GEOCODER_READ_TIMEOUT),
+    retries=settings.GEOCODER_RETRIES,
+    backoff=settings.GEOCODER_BACKOFF,
+    pool_size=settings.GEOCODER_POOL_SIZE,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.GEOCODER_BREAKER_THRESHOLD,
+        reset_timeout=settings.GEOCODER_BREAKER_RESET_TIMEOUT,
+        ),
+    )
 
 
 def fetch_coordinates(apikey, place):
-    base_url = "https://geocode-maps.yandex.ru/1.x"
     params = {"geocode": place, "apikey": apikey, "format": "json"}
-    response = requests.get(base_url, params=params)
-    response.raise_for_status()
-    found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+    with track_geocoder_call() as outcome:
+        found_places = geocoder_client.get(params)['response']['GeoObjectCollection']['featureMember']
+        if not found_places:
+            outcome['value'] = 'not_found'
+            return None
     most_relevant = found_places[0]
     lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
     return lon, lat
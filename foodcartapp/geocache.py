@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .addresses import normalize_address
+from .fetch_coordinates import fetch_coordinates
+from .models import GeocodedAddress, Place
+
+NOT_FOUND = (None, None)
+
+
+class GeocodeCache:
+    """Two-tier cache in front of the geocoder.
+
+    The in-process LRU answers repeated addresses without any IO, the
+    `GeocodedAddress` table shares results between workers and restarts.
+    Addresses the geocoder does not know are cached too, with a shorter TTL.
+    Concurrent lookups of one address wait for a single upstream call.
+    """
+
+    def __init__(self, maxsize, ttl, negative_ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def lookup(self, apikey, address):
+        key = normalize_address(address)
+        coords = self._get_local(key)
+        if coords is not None:
+            return coords
+
+        with self._lock:
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                coords = self._get_local(key)
+                if coords is None:
+                    coords = self._get_stored(key)
+                if coords is None:
+                    coords = fetch_coordinates(apikey, address) or NOT_FOUND
+                    self._store(key, coords)
+                self._set_local(key, coords)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        return coords
+
+    def remember(self, coords_by_address):
+        """Store fresh coordinates of the addresses, replacing cached ones, in a few queries."""
+        coords_by_key = {normalize_address(address): coords for address, coords in coords_by_address.items()}
+        stored = GeocodedAddress.objects.in_bulk(coords_by_key, field_name='address_key')
+        now = timezone.now()
+        updated = []
+        created = []
+        for key, coords in coords_by_key.items():
+            lng, lat = coords
+            entry = stored.get(key) or GeocodedAddress(address_key=key)
+            entry.lat, entry.lng, entry.found, entry.updated_at = lat, lng, coords != NOT_FOUND, now
+            (updated if entry.pk else created).append(entry)
+            self._set_local(key, coords)
+        GeocodedAddress.objects.bulk_update(updated, ['lat', 'lng', 'found', 'updated_at'])
+        GeocodedAddress.objects.bulk_create(created, ignore_conflicts=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            coords, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return coords
+
+    def _set_local(self, key, coords):
+        ttl = self.ttl if coords != NOT_FOUND else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (coords, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _get_stored(self, key):
+        now = timezone.now()
+        stored = GeocodedAddress.objects.filter(address_key=key).first()
+        if stored is None:
+            return None
+        ttl = self.ttl if stored.found else self.negative_ttl
+        if stored.updated_at + timedelta(seconds=ttl) < now:
+            return None
+        if not stored.found:
+            return NOT_FOUND
+        return str(stored.lng), str(stored.lat)
+
+    def _store(self, key, coords):
+        lng, lat = coords
+        GeocodedAddress.objects.update_or_create(
+            address_key=key,
+            defaults={'lat': lat, 'lng': lng, 'found': coords != NOT_FOUND},
+            )
+
+
+geocode_cache = GeocodeCache(
+    maxsize=settings.GEOCODE_CACHE_SIZE,
+    ttl=settings.GEOCODE_CACHE_TTL,
+    negative_ttl=settings.GEOCODE_CACHE_NEGATIVE_TTL,
+    )
+
+
+def fetch_coordinates_cached(apikey, place):
+    return geocode_cache.lookup(apikey, place)
+
+
+def geocode_place(apikey, place):
+    """Fill in the coordinates of the place from the geocoder, without saving it."""
+    place.lng, place.lat = fetch_coordinates_cached(apikey, place.address)
+    place.geocoded_at = timezone.now()
+
+
+def get_or_create_place(apikey, address):
+    """Return the place of the address, calling the geocoder only if its coordinates are unknown."""
+    place, is_created = Place.objects.get_or_create(address_key=normalize_address(address),
+                                                    defaults={'address': address})
+    if place.lat is None or place.lng is None:
+        geocode_place(apikey, place)
+        place.save(update_fields=['lat', 'lng', 'geocoded_at'])
+    return place
@@ -0,0 +1,165 @@
+import json
+import os
+import random
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from foodcartapp import geocache
+from foodcartapp.fake_data import ALMATY_BOUNDS, FakeDataGenerator, get_next_id
+from foodcartapp.models import Order
+
+
+def random_coords(rng):
+    min_lat, min_lng, max_lat, max_lng = ALMATY_BOUNDS
+    return round(rng.uniform(min_lat, max_lat), 6), round(rng.uniform(min_lng, max_lng), 6)
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержки и число SQL-запросов основных страниц и API на тестовой базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=50)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cold', action='store_true', help='очищать кэш Django перед каждым запросом')
+        parser.add_argument('--output', default='benchmark.json')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            cache.clear()
+            rng = random.Random(options['seed'])
+            geocoder_stub = mock.patch.object(geocache, 'fetch_coordinates',
+                                              lambda apikey, place: random_coords(rng)[::-1])
+            with geocoder_stub, mock.patch.dict(os.environ, {'GEO_API_KEY': 'benchmark'}):
+                self.seed(rng, options)
+                results = self.run_benchmarks(rng, options)
+                bulk_delete_results = self.measure_bulk_delete()
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'dataset': {name: options[name] for name in ('restaurants', 'products', 'orders', 'seed')},
+            'iterations': options['iterations'],
+            'cold_cache': options['cold'],
+            'database': settings.DATABASES['default']['ENGINE'],
+            'results': results,
+            'bulk_delete': bulk_delete_results,
+            }
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name}: p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, p99 {result['p99_ms']} мс, "
+                f"запросов {result['queries_mean']} (макс. {result['queries_max']})"
+                )
+        for name, result in bulk_delete_results.items():
+            self.stdout.write(
+                f"{name}: {result['orders']} заказов за {result['ms']} мс, запросов {result['queries']}, "
+                f"на пачку {result['queries_per_chunk']}"
+                )
+        self.stdout.write(f"Результаты записаны в {options['output']}")
+
+    def seed(self, rng, options):
+        generator = self.generator = FakeDataGenerator(seed=options['seed'])
+        self.products = generator.create_catalog(10, options['products'])
+        restaurants = generator.create_restaurants(options['restaurants'])
+        generator.create_menu(restaurants, self.products, density=1)
+        generator.create_orders(options['orders'], self.products)
+        generator.finish()
+
+        self.manager = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+
+    def run_benchmarks(self, rng, options):
+        client = Client()
+        client.force_login(self.manager)
+
+        def register_order():
+            cart = rng.sample(self.products, rng.randint(1, 5))
+            return client.post('/api/order/', {
+                'firstname': 'Иван',
+                'lastname': 'Иванов',
+                'phonenumber': '+77055197334',
+                'address': f'Абая, {rng.randint(0, 100)}',
+                'products': [{'product': product.id, 'quantity': rng.randint(1, 3)} for product in cart],
+                }, content_type='application/json')
+
+        scenarios = {
+            'register_order': register_order,
+            'product_list_api': lambda: client.get('/api/products/'),
+            'view_orders': lambda: client.get(reverse('restaurateur:view_orders')),
+            'view_products': lambda: client.get(reverse('restaurateur:ProductsView')),
+            }
+        return {
+            name: self.measure(scenario, options['iterations'], options['cold'])
+            for name, scenario in scenarios.items()
+            }
+
+    def measure_bulk_delete(self, chunk_counts=(1, 4)):
+        """Delete freshly generated orders with their places, one and several chunks at once."""
+        chunk_size = Order.objects.all().delete_chunk_size
+        results = {}
+        for chunk_count in chunk_counts:
+            first_order_id = get_next_id(Order)
+            self.generator.create_orders(chunk_size * chunk_count, self.products)
+            self.generator.finish()
+            with CaptureQueriesContext(connection) as queries:
+                started_at = time.perf_counter()
+                Order.objects.filter(id__gte=first_order_id).delete()
+                elapsed_ms = (time.perf_counter() - started_at) * 1000
+            results[f'delete_orders_{chunk_count}_chunks'] = {
+                'orders': chunk_size * chunk_count,
+                'ms': round(elapsed_ms, 2),
+                'queries': len(queries.captured_queries),
+                'queries_per_chunk': round(len(queries.captured_queries) / chunk_count, 1),
+                }
+        return results
+
+    def measure(self, scenario, iterations, cold):
+        timings = []
+        query_counts = []
+        for _ in range(iterations):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started_at = time.perf_counter()
+                response = scenario()
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started_at) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f'Ответ {response.status_code}: {response.content[:200]}')
+            query_counts.append(len(queries.captured_queries))
+        return {
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries_mean': round(sum(query_counts) / len(query_counts), 1),
+            'queries_max': max(query_counts),
+            }
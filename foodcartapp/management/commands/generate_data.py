@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodcartapp.fake_data import ALMATY_BOUNDS, FakeDataGenerator
+
+
+class Command(BaseCommand):
+    help = 'Наполняет базу воспроизводимыми тестовыми данными: ресторанами, меню и заказами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--menu-density', type=float, default=0.8, help='доля блюд в меню ресторана')
+        parser.add_argument('--availability', type=float, default=0.9, help='доля пунктов меню в продаже')
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--max-order-lines', type=int, default=5)
+        parser.add_argument('--days', type=int, default=30, help='за сколько дней распределить заказы')
+        parser.add_argument('--bounds', type=float, nargs=4, default=ALMATY_BOUNDS,
+                            metavar=('MIN_LAT', 'MIN_LNG', 'MAX_LAT', 'MAX_LNG'))
+        parser.add_argument('--skip-distances', action='store_true',
+                            help='не рассчитывать расстояния от заказов до ресторанов')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        generator = FakeDataGenerator(options['seed'], options['bounds'], options['batch_size'])
+
+        def report_progress(created_orders):
+            self.stdout.write(f"Заказов: {created_orders} из {options['orders']}")
+
+        with transaction.atomic():
+            products = generator.create_catalog(options['categories'], options['products'])
+            restaurants = generator.create_restaurants(options['restaurants'])
+            generator.create_menu(restaurants, products, options['menu_density'], options['availability'])
+            generator.create_orders(options['orders'], products, options['max_order_lines'], options['days'],
+                                    distances=not options['skip_distances'], progress=report_progress)
+            generator.finish()
+
+        elapsed = time.monotonic() - started_at
+        total = sum(generator.created.values())
+        for model_name, count in generator.created.items():
+            self.stdout.write(f'{model_name}: {count}')
+        self.stdout.write(f'Создано строк: {total} за {elapsed:.1f} с ({total / elapsed:.0f} строк/с)')
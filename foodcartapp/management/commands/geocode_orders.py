@@ -0,0 +1,96 @@
+import logging
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from environs import Env
+
+from foodcartapp.geocache import get_or_create_place
+from foodcartapp.models import GeocodingTask, Order
+from foodcartapp.order_distances import store_order_distances
+
+env = Env()
+env.read_env()
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Геокодирует адреса заказов, поставленных в очередь при оформлении'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='обработать очередь и выйти')
+        parser.add_argument('--stats', action='store_true', help='показать размер очереди и выйти')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=2, help='пауза между опросами пустой очереди, сек')
+        parser.add_argument('--max-attempts', type=int, default=settings.GEOCODE_MAX_ATTEMPTS)
+        parser.add_argument('--retry-delay', type=int, default=30, help='базовая задержка повтора, сек')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_stats()
+            return
+
+        apikey = env.str('GEO_API_KEY')
+        while True:
+            tasks = self.claim_tasks(options['batch_size'])
+            for task in tasks:
+                self.process(task, apikey, options['max_attempts'], options['retry_delay'])
+            if not tasks:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+    def claim_tasks(self, batch_size):
+        with transaction.atomic():
+            tasks = list(
+                GeocodingTask.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=GeocodingTask.PENDING, next_attempt_at__lte=timezone.now())
+                .order_by('next_attempt_at', 'id')[:batch_size]
+                )
+            GeocodingTask.objects.filter(id__in=[task.id for task in tasks]).update(
+                attempts=F('attempts') + 1,
+                next_attempt_at=timezone.now() + timedelta(minutes=5),
+                )
+        return tasks
+
+    def process(self, task, apikey, max_attempts, retry_delay):
+        attempts = task.attempts + 1
+        try:
+            place = get_or_create_place(apikey, task.address)
+            with transaction.atomic():
+                Order.objects.filter(id=task.order_id, place__isnull=True).update(
+                    place=place, modified_at=timezone.now())
+                store_order_distances(Order.objects.filter(id=task.order_id).select_related('place'))
+                GeocodingTask.objects.filter(id=task.id).update(status=GeocodingTask.DONE, last_error='')
+        except Exception as e:
+            # Any failure of one task, not only a network one, is retried and must not stop the worker
+            if not isinstance(e, requests.exceptions.RequestException):
+                logger.exception('Не удалось обработать задачу геокодирования %s', task.id)
+            if attempts >= max_attempts:
+                status = GeocodingTask.FAILED
+            else:
+                status = GeocodingTask.PENDING
+            GeocodingTask.objects.filter(id=task.id).update(
+                status=status,
+                next_attempt_at=timezone.now() + timedelta(seconds=retry_delay * 2 ** (attempts - 1)),
+                last_error=f'{type(e).__name__}: {e}',
+                )
+            self.stderr.write(f'{task.address}: {e!r}')
+
+    def print_stats(self):
+        by_status = dict(
+            GeocodingTask.objects.values_list('status').annotate(count=Count('id')).order_by()
+            )
+        for status, title in GeocodingTask.STATUS:
+            self.stdout.write(f'{title}: {by_status.get(status, 0)}')
+        oldest = GeocodingTask.objects.filter(status=GeocodingTask.PENDING).aggregate(
+            oldest=Min('created_at'))['oldest']
+        if oldest:
+            self.stdout.write(f'Самая старая задача ждёт: {timezone.now() - oldest}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodcartapp.addresses import merge_duplicate_places
+from foodcartapp.cache_versions import bump_version
+from foodcartapp.models import Order, Place, Restaurant
+from foodcartapp.order_distances import refresh_place_distances
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает нормализованные адреса мест и объединяет места с одинаковым адресом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            merged = merge_duplicate_places(Place, Order, Restaurant, options['batch_size'])
+        if merged:
+            bump_version('restaurants')
+            refresh_place_distances(set(merged.values()))
+        self.stdout.write(f'Объединено мест: {len(merged)}')
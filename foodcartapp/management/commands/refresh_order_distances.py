@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Order
+from foodcartapp.order_distances import store_order_distances
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает расстояния от заказов до ближайших ресторанов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--missing', action='store_true', help='только заказы, для которых расстояний ещё нет')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.filter(place__lat__isnull=False, place__lng__isnull=False)
+        if options['missing']:
+            orders = orders.filter(restaurant_distances__isnull=True)
+        orders = orders.select_related('place').only('id', 'place').order_by('id')
+        total = orders.count()
+
+        processed = 0
+        last_id = 0
+        while True:
+            batch = list(orders.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            store_order_distances(batch)
+            processed += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f'Заказов: {processed} из {total}')
@@ -0,0 +1,114 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from environs import Env
+
+from foodcartapp.cache_versions import bump_version
+from foodcartapp.fetch_coordinates import GeocoderUnavailable, fetch_coordinates
+from foodcartapp.geocache import NOT_FOUND, geocode_cache
+from foodcartapp.models import Place, Restaurant
+from foodcartapp.order_distances import refresh_place_distances
+
+env = Env()
+env.read_env()
+
+
+class RateLimiter:
+    """Let at most `rate` calls per second through, shared by all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+class Command(BaseCommand):
+    help = 'Заново геокодирует места без координат и места, геокодированные давно'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, help='также обновить места, геокодированные больше N дней назад')
+        parser.add_argument('--workers', type=int, default=4, help='число параллельных запросов к геокодеру')
+        parser.add_argument('--rps', type=float, default=5, help='не больше стольких запросов к геокодеру в секунду')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--after-id', type=int, default=0, help='продолжить с места с id больше указанного')
+
+    def handle(self, *args, **options):
+        apikey = env.str('GEO_API_KEY')
+        started_at = timezone.now()
+        stale = Q(lat__isnull=True) | Q(lng__isnull=True)
+        if options['older_than'] is not None:
+            cutoff = started_at - timedelta(days=options['older_than'])
+            stale |= Q(geocoded_at__isnull=True) | Q(geocoded_at__lt=cutoff)
+        places = Place.objects.filter(stale).exclude(geocoded_at__gte=started_at).only('id', 'address')
+        total = places.filter(id__gt=options['after_id']).count()
+
+        rate_limiter = RateLimiter(options['rps'])
+
+        def geocode(place):
+            rate_limiter.wait()
+            try:
+                return fetch_coordinates(apikey, place.address) or NOT_FOUND
+            except GeocoderUnavailable:
+                raise
+            except requests.exceptions.RequestException as e:
+                return e
+
+        processed = found = not_found = failed = 0
+        last_id = options['after_id']
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                batch = list(places.filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+                if not batch:
+                    break
+                try:
+                    results = list(executor.map(geocode, batch))
+                except GeocoderUnavailable as e:
+                    self.stderr.write(f'{e}. Продолжить можно с --after-id {last_id}')
+                    break
+
+                geocoded_at = timezone.now()
+                moved = []
+                not_found_ids = []
+                for place, result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        failed += 1
+                        self.stderr.write(f'{place.address}: {result}')
+                    elif result == NOT_FOUND:
+                        # Keep the coordinates the place has, the geocoder may just have lost the address
+                        not_found += 1
+                        not_found_ids.append(place.id)
+                    else:
+                        found += 1
+                        place.lng, place.lat = result
+                        place.geocoded_at = geocoded_at
+                        moved.append(place)
+                geocode_cache.remember({
+                    place.address: result for place, result in zip(batch, results)
+                    if not isinstance(result, Exception)
+                    })
+                Place.objects.bulk_update(moved, ['lat', 'lng', 'geocoded_at'])
+                Place.objects.filter(id__in=not_found_ids).update(geocoded_at=geocoded_at)
+                if Restaurant.objects.filter(place__in=moved).exists():
+                    bump_version('restaurants')
+                refresh_place_distances([place.id for place in moved])
+
+                processed += len(batch)
+                last_id = batch[-1].id
+                self.stdout.write(
+                    f'{processed}/{total}: найдено {found}, не найдено {not_found}, ошибок {failed}, '
+                    f'последний id {last_id}'
+                    )
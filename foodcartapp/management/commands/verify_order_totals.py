@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сохранённую стоимость заказов с суммой по позициям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='исправить расхождения')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        checked = mismatched = 0
+        last_id = 0
+        while True:
+            orders = list(
+                Order.objects
+                .filter(id__gt=last_id)
+                .with_details_cost()
+                .only('id', 'total_cost')
+                .order_by('id')[:options['batch_size']]
+                )
+            if not orders:
+                break
+            last_id = orders[-1].id
+            checked += len(orders)
+
+            broken = [order for order in orders if order.total_cost != order.details_cost]
+            mismatched += len(broken)
+            for order in broken:
+                self.stdout.write(f'Заказ {order.id}: сохранено {order.total_cost}, по позициям {order.details_cost}')
+            if broken and options['fix']:
+                for order in broken:
+                    order.total_cost = order.details_cost
+                    order.modified_at = timezone.now()
+                Order.objects.bulk_update(broken, ['total_cost', 'modified_at'])
+
+        self.stdout.write(f'Проверено заказов: {checked}, расхождений: {mismatched}')
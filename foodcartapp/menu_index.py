@@ -0,0 +1,49 @@
+from collections import defaultdict
+
+from .cache_versions import VersionedValue
+
+
+class MenuCoverageIndex:
+    """Per-restaurant bitsets of available products.
+
+    Every product gets a bit position, a restaurant's bitset has the bits of
+    the products it has on sale. A restaurant can cook an order when its
+    bitset contains every bit of the order's products.
+    """
+
+    def __init__(self, menu_items):
+        self.positions = {}
+        self.bitsets = defaultdict(int)
+        for restaurant_id, product_id in menu_items:
+            position = self.positions.setdefault(product_id, len(self.positions))
+            self.bitsets[restaurant_id] |= 1 << position
+
+    def mask(self, product_ids):
+        mask = 0
+        for product_id in product_ids:
+            position = self.positions.get(product_id)
+            if position is None:
+                return None
+            mask |= 1 << position
+        return mask
+
+    def restaurants_covering(self, product_ids):
+        mask = self.mask(product_ids)
+        if mask is None:
+            return set()
+        return {restaurant_id for restaurant_id, bitset in self.bitsets.items() if bitset & mask == mask}
+
+
+def build_menu_index():
+    from .models import RestaurantMenuItem
+
+    return MenuCoverageIndex(
+        RestaurantMenuItem.objects.filter(availability=True).values_list('restaurant_id', 'product_id').iterator()
+        )
+
+
+menu_index = VersionedValue('menu', build_menu_index)
+
+
+def get_menu_index():
+    return menu_index.get()
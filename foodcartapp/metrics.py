@@ -0,0 +1,170 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_request_state = threading.local()
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, aggregated in process memory."""
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[label_name]) for label_name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+            ]
+        with self._lock:
+            series_items = sorted((key, dict(series, buckets=list(series['buckets'])))
+                                  for key, series in self._series.items())
+        for key, series in series_items:
+            labels = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series['buckets']):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{format_labels(labels + [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(labels + [("le", "+Inf")])} {series["count"]}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {series["sum"]}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {series["count"]}')
+        return '\n'.join(lines)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+        )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+REQUEST_LATENCY = Histogram('starburger_request_duration_seconds', 'Время обработки запроса.',
+                            ('view', 'method', 'status'), LATENCY_BUCKETS)
+REQUEST_SQL_QUERIES = Histogram('starburger_request_sql_queries', 'Число SQL-запросов за запрос.',
+                                ('view',), COUNT_BUCKETS)
+REQUEST_SQL_DURATION = Histogram('starburger_request_sql_duration_seconds', 'Суммарное время SQL-запросов за запрос.',
+                                 ('view',), LATENCY_BUCKETS)
+REQUEST_GEOCODER_CALLS = Histogram('starburger_request_geocoder_calls', 'Число обращений к геокодеру за запрос.',
+                                   ('view',), COUNT_BUCKETS)
+GEOCODER_LATENCY = Histogram('starburger_geocoder_duration_seconds', 'Время ответа геокодера.',
+                             ('outcome',), LATENCY_BUCKETS)
+
+HISTOGRAMS = [REQUEST_LATENCY, REQUEST_SQL_QUERIES, REQUEST_SQL_DURATION, REQUEST_GEOCODER_CALLS, GEOCODER_LATENCY]
+
+
+@contextmanager
+def track_geocoder_call():
+    started_at = time.perf_counter()
+    outcome = {'value': 'ok'}
+    try:
+        yield outcome
+    except Exception:
+        outcome['value'] = 'error'
+        raise
+    finally:
+        GEOCODER_LATENCY.observe(time.perf_counter() - started_at, outcome=outcome['value'])
+        if hasattr(_request_state, 'geocoder_calls'):
+            _request_state.geocoder_calls += 1
+
+
+class SQLTimer:
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.duration += time.perf_counter() - started_at
+
+
+class MetricsMiddleware:
+    """Record latency, SQL and geocoder usage of every request per view.
+
+    Streaming responses are measured until their last chunk is sent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sql_timer = SQLTimer()
+        _request_state.geocoder_calls = 0
+        started_at = time.perf_counter()
+        try:
+            with connection.execute_wrapper(sql_timer):
+                response = self.get_response(request)
+        finally:
+            geocoder_calls = _request_state.geocoder_calls
+            del _request_state.geocoder_calls
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        view = resolver_match.view_name if resolver_match else 'unresolved'
+        labels = {'view': view, 'method': request.method, 'status': response.status_code}
+        REQUEST_GEOCODER_CALLS.observe(geocoder_calls, view=view)
+        if response.streaming:
+            response.streaming_content = self.stream(response.streaming_content, sql_timer, started_at, labels)
+        else:
+            self.observe(sql_timer, started_at, labels)
+        return response
+
+    def stream(self, chunks, sql_timer, started_at, labels):
+        try:
+            with connection.execute_wrapper(sql_timer):
+                yield from chunks
+        finally:
+            self.observe(sql_timer, started_at, labels)
+
+    def observe(self, sql_timer, started_at, labels):
+        REQUEST_LATENCY.observe(time.perf_counter() - started_at, **labels)
+        REQUEST_SQL_QUERIES.observe(sql_timer.queries, view=labels['view'])
+        REQUEST_SQL_DURATION.observe(sql_timer.duration, view=labels['view'])
+
+
+def is_metrics_request_allowed(request):
+    """Check the bearer token, metrics stay closed while METRICS_TOKEN is not set."""
+    if not settings.METRICS_TOKEN:
+        return False
+    if settings.METRICS_ALLOWED_IPS and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return False
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode())
+
+
+def metrics_view(request):
+    if not is_metrics_request_allowed(request):
+        return HttpResponseForbidden()
+    body = '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.5 on 2026-10-18 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0051_auto_20210417_1225'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodedAddress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address_key', models.CharField(max_length=255, unique=True, verbose_name='нормализованный адрес')),
+                ('lat', models.DecimalField(blank=True, decimal_places=8, max_digits=10, null=True, verbose_name='широта')),
+                ('lng', models.DecimalField(blank=True, decimal_places=8, max_digits=11, null=True, verbose_name='долгота')),
+                ('found', models.BooleanField(default=True, verbose_name='найден геокодером')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='время обновления')),
+            ],
+            options={
+                'verbose_name': 'кэш геокодера',
+                'verbose_name_plural': 'кэш геокодера',
+            },
+        ),
+    ]
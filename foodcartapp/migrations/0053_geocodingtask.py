@@ -0,0 +1,32 @@
+# Generated by Django 3.1.5 on 2026-10-18 03:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0052_geocodedaddress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodingTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=100, verbose_name='адрес')),
+                ('status', models.CharField(choices=[('PE', 'В очереди'), ('DN', 'Выполнена'), ('FL', 'Ошибка')], db_index=True, default='PE', max_length=2, verbose_name='статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='попыток')),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='время создания')),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='geocoding_task', to='foodcartapp.order', verbose_name='заказ')),
+            ],
+            options={
+                'verbose_name': 'задача геокодирования',
+                'verbose_name_plural': 'очередь геокодирования',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.5 on 2026-10-18 03:57
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_total_cost(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderDetails = apps.get_model('foodcartapp', 'OrderDetails')
+    details_cost = (
+        OrderDetails.objects
+        .filter(order=OuterRef('pk'))
+        .order_by()
+        .values('order')
+        .annotate(cost=Sum('product_price'))
+        .values('cost')
+    )
+    Order.objects.update(total_cost=Coalesce(Subquery(details_cost), Decimal(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0053_geocodingtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='стоимость заказа'),
+        ),
+        migrations.RunPython(fill_total_cost, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.5 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0054_order_total_cost'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['registered_at', 'id'], name='foodcartapp_registe_a63c12_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_status', 'registered_at', 'id'], name='foodcartapp_order_s_0db44e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_status', 'payment_method', 'registered_at', 'id'], name='foodcartapp_order_s_448f9c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_status', 'restaurant', 'registered_at', 'id'], name='foodcartapp_order_s_ca0271_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.5 on 2026-10-18 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0055_auto_20261018_0900'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='время изменения'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['modified_at', 'id'], name='foodcartapp_modifie_7c8136_idx'),
+        ),
+    ]
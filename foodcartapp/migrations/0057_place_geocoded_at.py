@@ -0,0 +1,25 @@
+# Generated by Django 3.1.5 on 2026-10-18 04:12
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_geocoded_at(apps, schema_editor):
+    Place = apps.get_model('foodcartapp', 'Place')
+    Place.objects.filter(lat__isnull=False, lng__isnull=False).update(geocoded_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0056_auto_20261018_0901'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='geocoded_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='время геокодирования'),
+        ),
+        migrations.RunPython(fill_geocoded_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.5 on 2026-10-18 04:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0057_place_geocoded_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRestaurantDistance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_km', models.FloatField(verbose_name='расстояние, км')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='restaurant_distances', to='foodcartapp.order', verbose_name='заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_distances', to='foodcartapp.restaurant', verbose_name='ресторан')),
+            ],
+            options={
+                'verbose_name': 'расстояние до ресторана',
+                'verbose_name_plural': 'расстояния до ресторанов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='orderrestaurantdistance',
+            index=models.Index(fields=['order', 'distance_km'], name='foodcartapp_order_i_cfd656_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='orderrestaurantdistance',
+            unique_together={('order', 'restaurant')},
+        ),
+    ]
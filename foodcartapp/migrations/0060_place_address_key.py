@@ -0,0 +1,34 @@
+# Generated by Django 3.1.5 on 2026-10-18 05:10
+
+from django.db import migrations, models
+
+from foodcartapp.addresses import merge_duplicate_places
+
+
+def fill_address_key(apps, schema_editor):
+    merge_duplicate_places(
+        apps.get_model('foodcartapp', 'Place'),
+        apps.get_model('foodcartapp', 'Order'),
+        apps.get_model('foodcartapp', 'Restaurant'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0059_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='address_key',
+            field=models.CharField(editable=False, max_length=255, null=True, verbose_name='нормализованный адрес'),
+        ),
+        migrations.RunPython(fill_address_key, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='place',
+            name='address_key',
+            field=models.CharField(editable=False, max_length=255, unique=True, verbose_name='нормализованный адрес'),
+        ),
+    ]
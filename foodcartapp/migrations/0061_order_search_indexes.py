@@ -0,0 +1,29 @@
+# Generated by Django 3.1.5 on 2026-10-18 04:23
+
+from django.db import migrations, models
+import phonenumber_field.modelfields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0060_place_address_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='firstname',
+            field=models.CharField(db_index=True, max_length=50, verbose_name='имя'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='lastname',
+            field=models.CharField(db_index=True, max_length=50, verbose_name='фамилия'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='phonenumber',
+            field=phonenumber_field.modelfields.PhoneNumberField(db_index=True, max_length=128, region=None, verbose_name='номер телефона'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.5 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0062_product_name_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='отпечаток заказа с ключом идемпотентности'),
+        ),
+    ]
@@ -1,22 +1,85 @@
+from collections import Counter
 from decimal import Decimal
 
+from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from environs import Env
-from geopy import distance
 from phonenumber_field.modelfields import PhoneNumberField
 
+from .addresses import normalize_address
+from .distances import format_ranking
+from .menu_index import get_menu_index
+
 env = Env()
 env.read_env()
 
 
 class CustomQuerySet(models.QuerySet):
-    def delete(self, *args, **kwargs):
-        for obj in self:
-            obj.place.delete()
-        super().delete(*args, **kwargs)
+    """Deleting restaurants or orders also deletes places nobody refers to anymore.
+
+    Rows are deleted in chunks of `delete_chunk_size`, so every chunk takes
+    the same number of queries, however many rows and places it involves.
+    """
+
+    delete_chunk_size = 1000
+
+    def delete(self):
+        deleted_count = 0
+        deleted_per_model = Counter()
+        while True:
+            chunk = list(self.order_by('pk').values_list('pk', 'place_id')[:self.delete_chunk_size])
+            if not chunk:
+                break
+            place_ids = {place_id for pk, place_id in chunk if place_id is not None}
+            with transaction.atomic(using=self.db, savepoint=False):
+                chunk_queryset = self.model._base_manager.using(self.db).filter(pk__in=[pk for pk, place_id in chunk])
+                count, per_model = self.delete_chunk(chunk_queryset)
+                deleted_count += count
+                deleted_per_model.update(per_model)
+                if place_ids:
+                    # Nothing refers to these places, so they go in one statement without the collector
+                    unused_places = (
+                        Place.objects
+                        .using(self.db)
+                        .filter(id__in=place_ids)
+                        .exclude(Exists(Order.objects.filter(place=OuterRef('pk'))))
+                        .exclude(Exists(Restaurant.objects.filter(place=OuterRef('pk'))))
+                        )
+                    count = unused_places._raw_delete(self.db)
+                    deleted_count += count
+                    deleted_per_model[Place._meta.label] += count
+        return deleted_count, dict(deleted_per_model)
+
+    def delete_chunk(self, chunk_queryset):
+        return chunk_queryset.delete()
+
+
+class OrderQuerySet(CustomQuerySet):
+    def delete_chunk(self, chunk_queryset):
+        # Order lines go in one statement, their signals would reprice the orders being deleted row by row
+        count = OrderDetails.objects.using(self.db).filter(order__in=chunk_queryset)._raw_delete(self.db)
+        deleted_count, per_model = chunk_queryset.delete()
+        if count:
+            per_model[OrderDetails._meta.label] = per_model.get(OrderDetails._meta.label, 0) + count
+        return deleted_count + count, per_model
+
+    def with_details_cost(self):
+        return self.annotate(details_cost=Coalesce(Sum('details__product_price'), Decimal(0)))
+
+    def refresh_total_cost(self):
+        details_cost = (
+            OrderDetails.objects
+            .filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+            .annotate(cost=Sum('product_price'))
+            .values('cost')
+            )
+        return self.update(total_cost=Coalesce(Subquery(details_cost), Decimal(0)), modified_at=timezone.now())
 
 
 class Restaurant(models.Model):
@@ -111,12 +174,12 @@ class Order(models.Model):
         (CRYPTOCURRENCY, 'Криптовалютный перевод'),
         ]
 
-    objects = CustomQuerySet.as_manager()
+    objects = OrderQuerySet.as_manager()
 
-    firstname = models.CharField(max_length=50, verbose_name='имя')
-    lastname = models.CharField(max_length=50, verbose_name='фамилия')
+    firstname = models.CharField(max_length=50, db_index=True, verbose_name='имя')
+    lastname = models.CharField(max_length=50, db_index=True, verbose_name='фамилия')
     address = models.CharField(max_length=100, verbose_name='адрес')
-    phonenumber = PhoneNumberField(verbose_name='номер телефона')
+    phonenumber = PhoneNumberField(db_index=True, verbose_name='номер телефона')
     registered_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='время рагистрации')
     updated_at = models.DateTimeField(verbose_name='время звонка', db_index=True, null=True)
     delivered_at = models.DateTimeField(verbose_name='время доставки', db_index=True, null=True)
@@ -128,6 +191,13 @@ class Order(models.Model):
     comment = models.TextField(max_length=250, verbose_name='комментарии', blank=True)
     place = models.ForeignKey('Place', on_delete=models.CASCADE, related_name='orders', null=True, blank=True,
                               verbose_name='место на карте')
+    total_cost = models.DecimalField('стоимость заказа', max_digits=10, decimal_places=2, default=0,
+                                     editable=False)
+    modified_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='время изменения')
+    idempotency_key = models.CharField('ключ идемпотентности', max_length=64, unique=True, null=True, blank=True,
+                                       editable=False)
+    idempotency_fingerprint = models.CharField('отпечаток заказа с ключом идемпотентности', max_length=64,
+                                               blank=True, editable=False)
 
     def full_name(self):
         return '{} {}'.format(self.firstname, self.lastname)
@@ -135,27 +205,28 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
+        indexes = [
+            models.Index(fields=['registered_at', 'id']),
+            models.Index(fields=['modified_at', 'id']),
+            models.Index(fields=['order_status', 'registered_at', 'id']),
+            models.Index(fields=['order_status', 'payment_method', 'registered_at', 'id']),
+            models.Index(fields=['order_status', 'restaurant', 'registered_at', 'id']),
+            ]
 
     def get_order_cost(self):
-        return self.details.aggregate(order_cost=Sum('product_price'))['order_cost']
-
-    def get_rest_rang(self):
-        rest_range = []
-        restaurants = Restaurant.objects.all()
+        return self.total_cost
 
-        for rest in restaurants:
-            if self.place:
-                order_coords = self.place.get_coords()
-                rest_coords = rest.get_coords()
-                rest_distance = distance.distance(order_coords, rest_coords).km
-                rest_range.append((rest.name, str(round(rest_distance, 3)) + ' km'))
-                rest_range.sort(key=lambda x: x[1])
+    def refresh_total_cost(self):
+        Order.objects.filter(pk=self.pk).refresh_total_cost()
+        self.refresh_from_db(fields=['total_cost'])
 
-            else:
-                rest_range.append(['No Geo API data'])
+    def get_rest_rang(self):
+        from .order_distances import get_order_rankings
 
-        rang_of_restrs = map(' - '.join, rest_range)
-        return rang_of_restrs
+        product_ids = list(self.details.values_list('product_id', flat=True))
+        restaurant_ids = get_menu_index().restaurants_covering(product_ids) if product_ids else None
+        ranking, = get_order_rankings([self], [restaurant_ids], settings.NEAREST_RESTAURANTS_COUNT or None)
+        return format_ranking(ranking)
 
 
 class OrderDetails(models.Model):
@@ -176,9 +247,11 @@ class OrderDetails(models.Model):
 
 class Place(models.Model):
     address = models.CharField(max_length=50, verbose_name='адресс')
+    address_key = models.CharField('нормализованный адрес', max_length=255, unique=True, editable=False)
     lat = models.DecimalField(max_digits=10, decimal_places=8, null=True, blank=True, verbose_name='широта')
     lng = models.DecimalField(max_digits=11, decimal_places=8, null=True, blank=True, verbose_name='долгота')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='время рагистрации ')
+    geocoded_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name='время геокодирования')
 
     def __str__(self):
         return self.address
@@ -186,6 +259,74 @@ class Place(models.Model):
     def get_coords(self):
         return (str(self.lat), str(self.lng))
 
+    def save(self, *args, **kwargs):
+        self.address_key = normalize_address(self.address)
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Место на карте'
         verbose_name_plural = 'Места на карте'
+
+
+class GeocodedAddress(models.Model):
+    address_key = models.CharField('нормализованный адрес', max_length=255, unique=True)
+    lat = models.DecimalField(max_digits=10, decimal_places=8, null=True, blank=True, verbose_name='широта')
+    lng = models.DecimalField(max_digits=11, decimal_places=8, null=True, blank=True, verbose_name='долгота')
+    found = models.BooleanField('найден геокодером', default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='время обновления')
+
+    def __str__(self):
+        return self.address_key
+
+    class Meta:
+        verbose_name = 'кэш геокодера'
+        verbose_name_plural = 'кэш геокодера'
+
+
+class GeocodingTask(models.Model):
+    PENDING = 'PE'
+    DONE = 'DN'
+    FAILED = 'FL'
+    STATUS = [
+        (PENDING, 'В очереди'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+        ]
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='geocoding_task',
+                                 verbose_name='заказ')
+    address = models.CharField(max_length=100, verbose_name='адрес')
+    status = models.CharField(max_length=2, choices=STATUS, default=PENDING, db_index=True,
+                              verbose_name='статус')
+    attempts = models.PositiveSmallIntegerField('попыток', default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='следующая попытка')
+    last_error = models.TextField('последняя ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='время создания')
+
+    def __str__(self):
+        return self.address
+
+    class Meta:
+        verbose_name = 'задача геокодирования'
+        verbose_name_plural = 'очередь геокодирования'
+
+
+class OrderRestaurantDistance(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='restaurant_distances',
+                              verbose_name='заказ')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='order_distances',
+                                   verbose_name='ресторан')
+    distance_km = models.FloatField('расстояние, км')
+
+    def __str__(self):
+        return f'{self.order_id} - {self.restaurant_id}: {self.distance_km} km'
+
+    class Meta:
+        verbose_name = 'расстояние до ресторана'
+        verbose_name_plural = 'расстояния до ресторанов'
+        unique_together = [
+            ['order', 'restaurant']
+            ]
+        indexes = [
+            models.Index(fields=['order', 'distance_km']),
+            ]
@@ -0,0 +1,203 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.utils import timezone
+
+from .distances import haversine_matrix, to_coords_array
+from .models import Order, OrderRestaurantDistance, Place, Restaurant
+from .spatial import KM_PER_DEGREE, get_restaurant_index
+
+
+def store_order_distances(orders):
+    """Replace stored distances of the orders with their nearest restaurants.
+
+    Up to ORDER_DISTANCES_COUNT restaurants within NEAREST_RESTAURANTS_RADIUS_KM
+    are stored per order, regardless of menus: the menu is applied on read.
+    Orders without coordinates end up with no rows.
+    """
+    orders = list(orders)
+    if not orders:
+        return
+    rankings = get_restaurant_index().rank(
+        [order.place for order in orders],
+        top_k=settings.ORDER_DISTANCES_COUNT,
+        radius_km=settings.NEAREST_RESTAURANTS_RADIUS_KM or None,
+        )
+    distances = [
+        OrderRestaurantDistance(order=order, restaurant=restaurant, distance_km=km)
+        for order, ranking in zip(orders, rankings)
+        for restaurant, km in ranking or []
+        ]
+    OrderRestaurantDistance.objects.filter(order__in=orders).delete()
+    OrderRestaurantDistance.objects.bulk_create(distances)
+    # The manager's page follows modified_at and has to redraw the restaurants of these orders
+    Order.objects.filter(id__in=[order.id for order in orders]).update(modified_at=timezone.now())
+
+
+def refresh_order_distances(orders, batch_size=1000):
+    """Recompute distances of the orders in batches."""
+    orders = orders.select_related('place').only('id', 'place').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(orders.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        store_order_distances(batch)
+        last_id = batch[-1].id
+
+
+def refresh_place_distances(place_ids, batch_size=1000):
+    """Recompute distances after the coordinates of the places have changed.
+
+    Covers both the orders delivered to the places and the restaurants
+    located at them.
+    """
+    refresh_order_distances(Order.objects.filter(place__in=place_ids), batch_size)
+
+    restaurant_ids = Restaurant.objects.filter(place__in=place_ids).values_list('id', flat=True)
+    if restaurant_ids:
+        refresh_restaurant_distances(restaurant_ids, batch_size)
+
+
+def refresh_restaurant_distances(restaurant_ids, batch_size=1000):
+    """Recompute distances of the unprocessed orders a moved or new restaurant may affect.
+
+    An order is affected if it already stores a distance to one of the
+    restaurants, or if one of them is now closer than the farthest stored
+    restaurant of the order, or the order stores fewer restaurants than it may.
+    Candidates are narrowed in SQL to the orders storing the restaurants and
+    the places within reach of their new coordinates.
+    """
+    restaurant_ids = set(restaurant_ids)
+    restaurants = [
+        restaurant for restaurant in get_restaurant_index().restaurants
+        if restaurant.id in restaurant_ids
+        ]
+    restaurant_coords = to_coords_array([restaurant.place for restaurant in restaurants])
+    restaurant_coords = restaurant_coords[~np.isnan(restaurant_coords).any(axis=1)]
+    radius_km = settings.NEAREST_RESTAURANTS_RADIUS_KM or np.inf
+
+    unprocessed_orders = Order.objects.filter(order_status=Order.UNPROCESSED)
+    candidates = Q(Exists(
+        OrderRestaurantDistance.objects.filter(order=OuterRef('pk'), restaurant__in=restaurant_ids)
+        ))
+    reach_km = get_reach_km(unprocessed_orders)
+    if reach_km is None:
+        candidates = Q()
+    else:
+        for lat, lng in restaurant_coords:
+            candidates |= Q(place__in=get_places_within(lat, lng, reach_km))
+
+    orders = (
+        unprocessed_orders
+        .filter(candidates, place__lat__isnull=False, place__lng__isnull=False)
+        .select_related('place')
+        .only('id', 'place')
+        .order_by('id')
+        )
+    last_id = 0
+    while True:
+        batch = list(orders.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        stored = defaultdict(lambda: (0, np.inf))
+        stored_distances = (
+            OrderRestaurantDistance.objects
+            .filter(order__in=batch)
+            .values('order')
+            .annotate(count=Count('id'), farthest=Max('distance_km'))
+            .values_list('order', 'count', 'farthest')
+            )
+        for order_id, count, farthest in stored_distances:
+            stored[order_id] = (count, farthest)
+        affected_ids = set(
+            OrderRestaurantDistance.objects
+            .filter(order__in=batch, restaurant__in=restaurant_ids)
+            .values_list('order_id', flat=True)
+            )
+
+        nearest_km = np.full(len(batch), np.inf)
+        if len(restaurant_coords):
+            matrix = haversine_matrix(to_coords_array([order.place for order in batch]), restaurant_coords)
+            nearest_km = np.where(np.isnan(matrix), np.inf, matrix).min(axis=1)
+        for order, km in zip(batch, nearest_km):
+            count, farthest = stored[order.id]
+            if km <= radius_km and (km < farthest or count < settings.ORDER_DISTANCES_COUNT):
+                affected_ids.add(order.id)
+
+        store_order_distances(order for order in batch if order.id in affected_ids)
+
+
+def get_reach_km(orders):
+    """Return how far a restaurant may be from an order and still get into its stored distances.
+
+    Returns None when there is no such limit: no radius is set and orders
+    store every restaurant there is, or store nothing yet.
+    """
+    if settings.NEAREST_RESTAURANTS_RADIUS_KM:
+        return settings.NEAREST_RESTAURANTS_RADIUS_KM
+    if len(get_restaurant_index().restaurants) <= settings.ORDER_DISTANCES_COUNT:
+        return None
+    return (
+        OrderRestaurantDistance.objects
+        .filter(order__in=orders)
+        .aggregate(farthest=Max('distance_km'))['farthest']
+        )
+
+
+def get_places_within(lat, lng, reach_km):
+    """Return ids of places inside the lat/lng bounding box of a circle around the point."""
+    lat_delta = reach_km / KM_PER_DEGREE
+    lng_delta = reach_km / (KM_PER_DEGREE * math.cos(math.radians(min(abs(lat) + lat_delta, 89.9))))
+    return Place.objects.filter(
+        lat__range=(lat - lat_delta, lat + lat_delta),
+        lng__range=(lng - lng_delta, lng + lng_delta),
+        ).values('id')
+
+
+def get_order_rankings(orders, restaurant_ids=None, top_k=None):
+    """Return, for every order, up to top_k (restaurant, km) pairs sorted by distance.
+
+    `restaurant_ids` holds, for every order, the ids of restaurants allowed
+    for it or None for any restaurant. Only if the stored distances hold no
+    allowed restaurant, the order is ranked by the live restaurant index.
+    Orders without coordinates get None.
+    """
+    rows = (
+        OrderRestaurantDistance.objects
+        .filter(order__in=orders)
+        .select_related('restaurant')
+        .only('order_id', 'distance_km', 'restaurant__id', 'restaurant__name')
+        .order_by('order_id', 'distance_km')
+        )
+    distances = defaultdict(list)
+    for row in rows:
+        distances[row.order_id].append((row.restaurant, row.distance_km))
+
+    if restaurant_ids is None:
+        restaurant_ids = [None] * len(orders)
+    restaurant_index = None
+    rankings = []
+    for order, allowed in zip(orders, restaurant_ids):
+        if not order.place or order.place.lat is None or order.place.lng is None:
+            rankings.append(None)
+            continue
+        ranking = [
+            (restaurant, km) for restaurant, km in distances[order.id]
+            if allowed is None or restaurant.id in allowed
+            ]
+        is_cut = len(distances[order.id]) >= settings.ORDER_DISTANCES_COUNT
+        if not ranking and allowed and is_cut:
+            # No stored restaurant can cook the order, but one beyond the stored nearest ones may
+            if restaurant_index is None:
+                restaurant_index = get_restaurant_index()
+            ranking = restaurant_index.nearest(
+                order.place, top_k, settings.NEAREST_RESTAURANTS_RADIUS_KM or None, allowed,
+                )
+        rankings.append(ranking[:top_k])
+    return rankings
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that takes the size of a large unfiltered table from database statistics.
+
+    COUNT(*) scans the whole table, which takes seconds on millions of orders.
+    PostgreSQL keeps an estimate of the row count in pg_class, it is used
+    when the list is not filtered and the table is larger than
+    ADMIN_EXACT_COUNT_THRESHOLD. Other databases and filtered lists are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate_count()
+        if estimate is not None and estimate > settings.ADMIN_EXACT_COUNT_THRESHOLD:
+            return estimate
+        return super().count
+
+    def estimate_count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query') or queryset.query.where or queryset.query.is_sliced:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] < 0:
+            return None
+        return int(row[0])
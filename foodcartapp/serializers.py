@@ -1,20 +1,49 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import CharField, ListSerializer, ModelSerializer, PrimaryKeyRelatedField
 
-from foodcartapp.models import Order, OrderDetails, Place
+from foodcartapp.models import Order, OrderDetails, Place, Product
+
+
+class ProductField(PrimaryKeyRelatedField):
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Product.objects.all(), **kwargs)
+        self.prefetched = {}
+
+    def to_internal_value(self, data):
+        try:
+            return self.prefetched[int(data)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_internal_value(data)
+
+
+class OrderDetailsListSerializer(ListSerializer):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            product_ids = []
+            for item in data:
+                try:
+                    product_ids.append(int(item['product']))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            self.child.fields['product'].prefetched = Product.objects.in_bulk(product_ids)
+        return super().to_internal_value(data)
 
 
 class OrderDetailsSerializer(ModelSerializer):
+    product = ProductField()
+
     class Meta:
         model = OrderDetails
         fields = ('product', 'quantity')
+        list_serializer_class = OrderDetailsListSerializer
 
 
 class OrderSerializer(ModelSerializer):
     products = OrderDetailsSerializer(many=True, write_only=True)
+    idempotency_key = CharField(max_length=64, required=False, allow_null=True)
 
     class Meta:
         model = Order
-        fields = ('firstname', 'lastname', 'address', 'phonenumber', 'products')
+        fields = ('firstname', 'lastname', 'address', 'phonenumber', 'products', 'idempotency_key')
 
 
 class PlaceSerializer(ModelSerializer):
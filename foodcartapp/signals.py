@@ -0,0 +1,54 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache_versions import bump_version
+from .models import Order, OrderDetails, OrderRestaurantDistance, Place, Product, ProductCategory, Restaurant
+from .models import RestaurantMenuItem
+from .order_distances import refresh_order_distances
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def restaurants_changed(sender, instance, **kwargs):
+    bump_version('restaurants')
+
+
+@receiver(pre_delete, sender=Restaurant)
+def remember_restaurant_orders(sender, instance, **kwargs):
+    # Distances to the restaurant are deleted with it, these orders need the next nearest restaurants
+    instance.affected_order_ids = list(
+        OrderRestaurantDistance.objects
+        .filter(restaurant=instance, order__order_status=Order.UNPROCESSED)
+        .values_list('order_id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Restaurant)
+def refill_order_distances(sender, instance, **kwargs):
+    affected_order_ids = getattr(instance, 'affected_order_ids', None)
+    if affected_order_ids:
+        refresh_order_distances(Order.objects.filter(id__in=affected_order_ids))
+
+
+@receiver([post_save, post_delete], sender=OrderDetails)
+def order_details_changed(sender, instance, **kwargs):
+    # Covers the admin, product deletion cascades and any other save or delete of a single line
+    Order.objects.filter(id=instance.order_id).refresh_total_cost()
+
+
+@receiver(post_save, sender=Place)
+def place_changed(sender, instance, **kwargs):
+    # Deleting a place cascades to its restaurants, which bumps the version by itself
+    if instance.restaurants.exists():
+        bump_version('restaurants')
+
+
+@receiver([post_save, post_delete], sender=RestaurantMenuItem)
+def menu_changed(sender, instance, **kwargs):
+    bump_version('menu')
+    bump_version('catalog')
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductCategory)
+def catalog_changed(sender, instance, **kwargs):
+    bump_version('catalog')
@@ -0,0 +1,122 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from .cache_versions import VersionedValue
+from .distances import DistanceEngine, haversine_matrix, to_coords_array
+
+KM_PER_DEGREE = 111.19
+
+
+class RestaurantIndex(DistanceEngine):
+    """Grid of restaurant coordinates for k-nearest and radius queries.
+
+    Restaurants are bucketed into square cells of `cell_deg` degrees. A query
+    scans rings of cells around the place and stops as soon as no restaurant
+    in the unscanned rings can be closer than the ones already found.
+    """
+
+    def __init__(self, restaurants, cell_deg=0.05, exact_top_k=0):
+        super().__init__(restaurants, exact_top_k)
+        self.cell_deg = cell_deg
+        self.buckets = defaultdict(list)
+        for index, (lat, lng) in enumerate(self.coords):
+            if not np.isnan(lat) and not np.isnan(lng):
+                self.buckets[self._cell(lat, lng)].append(index)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def _ring(self, row, col, ring):
+        if ring == 0:
+            return [(row, col)]
+        cells = []
+        for delta in range(-ring, ring + 1):
+            cells.extend([(row - ring, col + delta), (row + ring, col + delta)])
+        for delta in range(-ring + 1, ring):
+            cells.extend([(row + delta, col - ring), (row + delta, col + ring)])
+        return cells
+
+    def _lower_bound_km(self, lat, ring):
+        top_lat = min(abs(lat) + (ring + 1) * self.cell_deg, 89.9)
+        return ring * self.cell_deg * KM_PER_DEGREE * math.cos(math.radians(top_lat))
+
+    def nearest(self, place, k=None, radius_km=None, restaurant_ids=None):
+        """Return up to k (restaurant, km) pairs within radius_km, nearest first.
+
+        With `restaurant_ids` only these restaurants are considered.
+        Returns None when the place has no coordinates.
+        """
+        coords = to_coords_array([place])
+        if np.isnan(coords).any():
+            return None
+        lat, lng = coords[0]
+        row, col = self._cell(lat, lng)
+
+        candidates = []
+        scanned = 0
+        ring = 0
+        while scanned < len(self.buckets):
+            if 8 * ring > len(self.buckets):
+                # Sparse surroundings: cheaper to take every remaining bucket than to walk empty rings
+                for (cell_row, cell_col), indexes in self.buckets.items():
+                    if max(abs(cell_row - row), abs(cell_col - col)) >= ring:
+                        candidates.extend(self._allowed(indexes, restaurant_ids))
+                break
+            for cell in self._ring(row, col, ring):
+                indexes = self.buckets.get(cell)
+                if indexes:
+                    candidates.extend(self._allowed(indexes, restaurant_ids))
+                    scanned += 1
+            lower_bound = self._lower_bound_km(lat, ring)
+            if radius_km is not None and lower_bound > radius_km:
+                break
+            if k is not None and len(candidates) >= k:
+                distances = haversine_matrix(coords, self.coords[candidates])[0]
+                if np.count_nonzero(distances <= lower_bound) >= k:
+                    break
+            ring += 1
+
+        if not candidates:
+            return []
+        distances = haversine_matrix(coords, self.coords[candidates])[0]
+        order = np.argsort(distances, kind='stable')
+        if radius_km is not None:
+            order = order[distances[order] <= radius_km]
+        ranking = [(self.restaurants[candidates[index]], float(distances[index])) for index in order[:k]]
+        if self.exact_top_k:
+            ranking = self._refine(place, ranking)
+        return ranking
+
+    def _allowed(self, indexes, restaurant_ids):
+        if restaurant_ids is None:
+            return indexes
+        return [index for index in indexes if self.restaurants[index].id in restaurant_ids]
+
+    def rank(self, places, top_k=None, radius_km=None, restaurant_ids=None):
+        if top_k is None and radius_km is None and restaurant_ids is None:
+            return super().rank(places)
+        if restaurant_ids is None:
+            restaurant_ids = [None] * len(places)
+        return [
+            self.nearest(place, top_k, radius_km, allowed)
+            for place, allowed in zip(places, restaurant_ids)
+            ]
+
+
+def build_restaurant_index():
+    from .models import Restaurant
+
+    return RestaurantIndex(
+        Restaurant.objects.select_related('place').order_by('id'),
+        exact_top_k=settings.DISTANCE_EXACT_TOP_K,
+        )
+
+
+restaurant_index = VersionedValue('restaurants', build_restaurant_index)
+
+
+def get_restaurant_index():
+    return restaurant_index.get()
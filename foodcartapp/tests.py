@@ -1,8 +1,582 @@
-dicts = {
-    "products": [{"product": 1, "quantity": 1}, {"product": 2, "quantity": 1}], "firstname": "Yerkin",
-    "lastname": "Akhmetzhanov", "phonenumber": "+77055197334", "address": "5 E, Sarayshyq str,apt 32"
-    }
-distr = {'Burger King': 1.1, 'KFC respublika': 1.18}
-
-for i, num in distr.items():
-    print(i, num)
+import gzip
+import json
+import os
+from io import StringIO
+from unittest import mock
+
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from foodcartapp.addresses import merge_duplicate_places
+from foodcartapp.distances import DistanceEngine
+from foodcartapp.fetch_coordinates import CircuitBreaker, GeocoderClient, GeocoderUnavailable, fetch_coordinates
+from foodcartapp.fetch_coordinates import geocoder_client
+from foodcartapp.management.commands import geocode_orders
+from foodcartapp.models import GeocodingTask, Order, OrderRestaurantDistance, Place, Product, ProductCategory
+from foodcartapp.models import Restaurant
+from foodcartapp.order_distances import get_order_rankings, refresh_restaurant_distances, store_order_distances
+from foodcartapp.spatial import RestaurantIndex
+
+
+@override_settings(GEOCODE_ORDERS_ASYNC=True)
+class RegisterOrderIdempotencyTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = ProductCategory.objects.create(name='Бургеры')
+        self.product = Product.objects.create(name='Бургер', price=100, category=category, image='burger.jpg')
+
+    def get_order_data(self, **fields):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+77055197334',
+            'address': 'Абая, 10',
+            'products': [{'product': self.product.id, 'quantity': 2}],
+            **fields,
+            }
+
+    def test_retry_with_same_key_returns_same_order(self):
+        first = self.client.post('/api/order/', self.get_order_data(), content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='checkout-1')
+        retry = self.client.post('/api/order/', self.get_order_data(), content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Order.objects.get().details.count(), 1)
+
+    def test_same_key_with_another_order_is_rejected(self):
+        first = self.client.post('/api/order/', self.get_order_data(), content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='checkout-1')
+        other = self.client.post('/api/order/', self.get_order_data(firstname='Пётр', address='Сатпаева, 5'),
+                                 content_type='application/json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(other.status_code, 422)
+        self.assertNotContains(other, 'Абая', status_code=422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_orders_without_key_are_not_deduplicated(self):
+        for _ in range(2):
+            response = self.client.post('/api/order/', self.get_order_data(), content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_repeated_key_in_batch_creates_one_order(self):
+        orders_data = [
+            self.get_order_data(idempotency_key='checkout-1'),
+            self.get_order_data(idempotency_key='checkout-2', address='Сатпаева, 5'),
+            self.get_order_data(idempotency_key='checkout-1'),
+            ]
+        response = self.client.post('/api/orders/batch/', orders_data, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+        orders = response.json()
+        self.assertEqual(orders[0], orders[2])
+        self.assertEqual([order['address'] for order in orders], ['Абая, 10', 'Сатпаева, 5', 'Абая, 10'])
+
+        retry = self.client.post('/api/orders/batch/', orders_data, content_type='application/json')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), orders)
+        self.assertEqual(Order.objects.count(), 2)
+
+    @override_settings(GEOCODE_ORDERS_ASYNC=False)
+    def test_batch_queues_unknown_addresses_without_geocoding(self):
+        Place.objects.create(address='Абая, 10', lat=43.24, lng=76.92)
+        with mock.patch('foodcartapp.geocache.fetch_coordinates') as fetch_coordinates:
+            response = self.client.post('/api/orders/batch/', [
+                self.get_order_data(), self.get_order_data(address='Сатпаева, 5'),
+                ], content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        fetch_coordinates.assert_not_called()
+        known, unknown = Order.objects.order_by('id')
+        self.assertEqual(known.place.address, 'Абая, 10')
+        self.assertIsNone(unknown.place)
+        self.assertEqual(list(GeocodingTask.objects.values_list('order_id', 'address')), [(unknown.id, 'Сатпаева, 5')])
+
+    def test_repeated_key_with_another_order_in_batch_is_rejected(self):
+        orders_data = [
+            self.get_order_data(idempotency_key='checkout-1'),
+            self.get_order_data(idempotency_key='checkout-1', address='Сатпаева, 5'),
+            ]
+        response = self.client.post('/api/orders/batch/', orders_data, content_type='application/json')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Order.objects.exists())
+
+
+class DeleteWithPlacesTest(TestCase):
+    def create_order(self, place=None):
+        return Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+77055197334',
+                                    address=place.address if place else 'Абая, 10', place=place)
+
+    def test_unreferenced_places_are_deleted_and_shared_kept(self):
+        own_place = Place.objects.create(address='Абая, 10', lat=43.2, lng=76.9)
+        shared_place = Place.objects.create(address='Сатпаева, 5', lat=43.3, lng=76.8)
+        restaurant_place = Place.objects.create(address='Достык, 1', lat=43.4, lng=76.7)
+        Restaurant.objects.create(name='Ресторан', address=restaurant_place.address, place=restaurant_place)
+        self.create_order(own_place)
+        self.create_order(shared_place)
+        kept_order = self.create_order(shared_place)
+        self.create_order(restaurant_place)
+        self.create_order()
+
+        _, per_model = Order.objects.exclude(id=kept_order.id).delete()
+
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [kept_order.id])
+        self.assertFalse(Place.objects.filter(id=own_place.id).exists())
+        self.assertCountEqual(Place.objects.values_list('id', flat=True), [shared_place.id, restaurant_place.id])
+        self.assertEqual(per_model[Order._meta.label], 4)
+        self.assertEqual(per_model[Place._meta.label], 1)
+
+    def test_deleting_restaurants_deletes_their_places(self):
+        place = Place.objects.create(address='Достык, 1', lat=43.4, lng=76.7)
+        Restaurant.objects.create(name='Ресторан', address=place.address, place=place)
+        Restaurant.objects.create(name='Без места')
+
+        Restaurant.objects.all().delete()
+
+        self.assertFalse(Restaurant.objects.exists())
+        self.assertFalse(Place.objects.exists())
+
+    def test_delete_spans_several_chunks(self):
+        places = [Place.objects.create(address=f'Абая, {number}', lat=43.2, lng=76.9) for number in range(5)]
+        for place in places:
+            self.create_order(place)
+            self.create_order(place)
+        orders = Order.objects.all()
+        orders.delete_chunk_size = 3
+
+        count, per_model = orders.delete()
+
+        self.assertEqual(count, 15)
+        self.assertEqual(per_model, {Order._meta.label: 10, Place._meta.label: 5})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Place.objects.exists())
+
+
+class MergeDuplicatePlacesTest(TestCase):
+    def create_place(self, address, lat=None, lng=None):
+        # Places saved with distinct keys, then given equal addresses, as rows did before the keys existed
+        place = Place.objects.create(address=f'Временный адрес {Place.objects.count()}', lat=lat, lng=lng)
+        Place.objects.filter(id=place.id).update(address=address)
+        return place
+
+    def test_place_with_coordinates_is_kept(self):
+        without_coords = self.create_place('Абая, 10')
+        with_coords = self.create_place('абая 10', lat=43.2, lng=76.9)
+        other = self.create_place('АБАЯ 10.', lat=43.3, lng=76.8)
+        order = Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+77055197334',
+                                     address='Абая, 10', place=without_coords)
+        restaurant = Restaurant.objects.create(name='Ресторан', address='Абая, 10', place=other)
+
+        merged = merge_duplicate_places(Place, Order, Restaurant, batch_size=1)
+
+        self.assertEqual(merged, {without_coords.id: with_coords.id, other.id: with_coords.id})
+        self.assertEqual(list(Place.objects.values_list('id', 'address_key')), [(with_coords.id, 'абая 10')])
+        order.refresh_from_db()
+        restaurant.refresh_from_db()
+        self.assertEqual(order.place_id, with_coords.id)
+        self.assertEqual(restaurant.place_id, with_coords.id)
+
+    def test_keys_are_fixed_without_merging_distinct_places(self):
+        first = self.create_place('Абая, 10', lat=43.2, lng=76.9)
+        second = self.create_place('Сатпаева, 5', lat=43.3, lng=76.8)
+
+        self.assertEqual(merge_duplicate_places(Place, Order, Restaurant), {})
+        self.assertEqual(
+            dict(Place.objects.values_list('id', 'address_key')),
+            {first.id: 'абая 10', second.id: 'сатпаева 5'},
+            )
+
+
+@mock.patch.dict(os.environ, {'GEO_API_KEY': 'test'})
+class GeocodeOrdersTest(TestCase):
+    def setUp(self):
+        order = Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+77055197334',
+                                     address='Абая, 10')
+        self.task = GeocodingTask.objects.create(order=order, address=order.address)
+
+    def run_worker(self, geocode):
+        with mock.patch.object(geocode_orders, 'get_or_create_place', geocode), \
+                self.assertLogs('foodcartapp', level='ERROR'):
+            call_command('geocode_orders', once=True, max_attempts=2, retry_delay=0, stderr=StringIO())
+        self.task.refresh_from_db()
+
+    def test_unexpected_error_is_retried_and_fails_the_task(self):
+        geocode = mock.Mock(side_effect=KeyError('GeoObjectCollection'))
+
+        self.run_worker(geocode)
+
+        self.assertEqual(geocode.call_count, 2)
+        self.assertEqual(self.task.status, GeocodingTask.FAILED)
+        self.assertEqual(self.task.attempts, 2)
+        self.assertIn('KeyError', self.task.last_error)
+        self.assertIsNone(self.task.order.place)
+
+
+@override_settings(ORDER_DISTANCES_COUNT=3, NEAREST_RESTAURANTS_RADIUS_KM=0)
+class OrderDistancesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.restaurants = [
+            self.create_restaurant(f'Ресторан {number}', 43.2 + number * 0.02, 76.9 + number % 3 * 0.03)
+            for number in range(8)
+            ]
+        self.orders = []
+        for number in range(12):
+            place = Place.objects.create(address=f'Заказ {number}', lat=43.19 + number * 0.013, lng=76.92)
+            self.orders.append(Order.objects.create(firstname='Иван', lastname='Иванов',
+                                                    phonenumber='+77055197334', address=place.address, place=place))
+        Order.objects.filter(id=self.orders[-1].id).update(order_status=Order.PROCESSED)
+        self.orders = list(Order.objects.select_related('place').order_by('id'))
+        store_order_distances(self.orders)
+
+    def create_restaurant(self, name, lat, lng):
+        place = Place.objects.create(address=name, lat=lat, lng=lng)
+        return Restaurant.objects.create(name=name, address=name, place=place)
+
+    def get_stored_distances(self, orders):
+        return set(
+            OrderRestaurantDistance.objects
+            .filter(order__in=orders)
+            .values_list('order_id', 'restaurant_id')
+            )
+
+    def assert_matches_full_recompute(self):
+        unprocessed = [order for order in self.orders if order.order_status == Order.UNPROCESSED]
+        stored = self.get_stored_distances(unprocessed)
+        store_order_distances(unprocessed)
+        self.assertEqual(stored, self.get_stored_distances(unprocessed))
+
+    def test_moved_restaurant_refresh_matches_full_recompute(self):
+        for restaurant, (lat, lng) in zip(self.restaurants[:3], [(43.33, 76.92), (43.1, 76.8), (43.25, 76.93)]):
+            Place.objects.filter(id=restaurant.place_id).update(lat=lat, lng=lng)
+            Restaurant.objects.get(id=restaurant.id).save()
+            refresh_restaurant_distances([restaurant.id])
+            self.assert_matches_full_recompute()
+
+    def test_new_restaurant_refresh_matches_full_recompute(self):
+        restaurant = self.create_restaurant('Новый ресторан', 43.27, 76.92)
+        refresh_restaurant_distances([restaurant.id])
+        self.assert_matches_full_recompute()
+
+    def test_deleted_restaurant_is_replaced_by_the_next_nearest(self):
+        order = self.orders[0]
+        nearest = OrderRestaurantDistance.objects.filter(order=order).order_by('distance_km').first()
+        Restaurant.objects.filter(id=nearest.restaurant_id).delete()
+
+        self.assertEqual(OrderRestaurantDistance.objects.filter(order=order).count(), 3)
+        self.assert_matches_full_recompute()
+
+    def test_farther_restaurant_able_to_cook_is_found(self):
+        order = self.orders[0]
+        stored_ids = {restaurant_id for order_id, restaurant_id in self.get_stored_distances([order])}
+        farthest = next(restaurant for restaurant in reversed(self.restaurants) if restaurant.id not in stored_ids)
+
+        ranking, = get_order_rankings([order], [{farthest.id}], top_k=5)
+        self.assertEqual([restaurant.id for restaurant, km in ranking], [farthest.id])
+
+        ranking, = get_order_rankings([order], [set()], top_k=5)
+        self.assertEqual(ranking, [])
+
+
+class OrderTotalCostTest(TestCase):
+    def setUp(self):
+        category = ProductCategory.objects.create(name='Бургеры')
+        self.burger = Product.objects.create(name='Бургер', price=100, category=category, image='burger.jpg')
+        self.cola = Product.objects.create(name='Кола', price=50, category=category, image='cola.jpg')
+        place = Place.objects.create(address='Абая, 10', lat=43.24, lng=76.92)
+        self.order = Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+77055197334',
+                                          address=place.address, place=place)
+        self.order.details.create(product=self.burger, quantity=1, product_price=100)
+        self.order.details.create(product=self.cola, quantity=2, product_price=100)
+
+    def get_form_data(self, response):
+        """Return the POST data of the admin change form as it was rendered."""
+        data = {}
+        forms = [response.context['adminform'].form]
+        for formset in response.context['inline_admin_formsets']:
+            forms.append(formset.formset.management_form)
+            forms.extend(formset.formset.forms)
+        for form in forms:
+            for field in form:
+                value = field.value()
+                if value is not None and value is not False:
+                    data[field.html_name] = value
+        return data
+
+    def test_admin_inline_reprices_changed_line(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        url = reverse('admin:foodcartapp_order_change', args=(self.order.id,))
+        Product.objects.filter(id=self.burger.id).update(price=150)
+
+        data = self.get_form_data(self.client.get(url))
+        data.update({'updated_at_0': '2021-01-01', 'updated_at_1': '12:00', 'delivered_at_0': '2021-01-01',
+                     'delivered_at_1': '13:00', 'details-0-quantity': 3})
+        response = self.client.post(url, data)
+
+        self.assertEqual(response.status_code, 302)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.details.get(product=self.burger).product_price, 450)
+        self.assertEqual(self.order.details.get(product=self.cola).product_price, 100)
+        self.assertEqual(self.order.total_cost, 550)
+
+    def test_deleting_product_reprices_orders(self):
+        self.order.refresh_total_cost()
+        self.assertEqual(self.order.total_cost, 200)
+
+        self.cola.delete()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_cost, 100)
+
+
+class CircuitBreakerTest(TestCase):
+    def setUp(self):
+        self.now = 1000
+        patcher = mock.patch('foodcartapp.fetch_coordinates.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    def test_opens_after_threshold_failures_in_a_row(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    def test_lets_one_trial_call_through_after_timeout(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 29
+        self.assertFalse(self.breaker.allow())
+
+        self.now += 1
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_trial_success_closes_and_failure_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+
+class GeocoderClientTest(TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        self.client = GeocoderClient(timeout=(1, 1), retries=2, backoff=0.5, pool_size=2, breaker=self.breaker)
+        patcher = mock.patch('foodcartapp.fetch_coordinates.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_response(self, status_code):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = b'{"response": {}}'
+        return response
+
+    def test_pool_blocks_at_its_size(self):
+        adapter = self.client.session.get_adapter(GeocoderClient.base_url)
+        self.assertTrue(adapter._pool_block)
+        self.assertEqual(adapter._pool_maxsize, 2)
+
+    @mock.patch('foodcartapp.fetch_coordinates.random.uniform', side_effect=[0.5, 1.5])
+    def test_transient_errors_are_retried_with_jittered_backoff(self, uniform):
+        responses = [requests.exceptions.ConnectionError(), self.get_response(503), self.get_response(200)]
+        with mock.patch.object(self.client.session, 'get', side_effect=responses) as get:
+            self.assertEqual(self.client.get({}), {'response': {}})
+
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual([call.args for call in self.sleep.call_args_list], [(0.25,), (1.5,)])
+        uniform.assert_called_with(0.5, 1.5)
+
+    def test_exhausted_retries_count_one_failure(self):
+        with mock.patch.object(self.client.session, 'get', return_value=self.get_response(503)) as get:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.client.get({})
+
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(self.breaker._failures, 1)
+
+    def test_other_errors_are_not_retried(self):
+        with mock.patch.object(self.client.session, 'get', side_effect=requests.exceptions.InvalidURL()) as get:
+            with self.assertRaises(requests.exceptions.InvalidURL):
+                self.client.get({})
+        self.assertEqual(get.call_count, 1)
+
+    def test_open_breaker_skips_the_request(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        with mock.patch.object(self.client.session, 'get') as get:
+            with self.assertRaises(GeocoderUnavailable):
+                self.client.get({})
+        get.assert_not_called()
+
+
+class ProductListApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = ProductCategory.objects.create(name='Бургеры')
+        self.product = Product.objects.create(name='Бургер', price=100, category=category, image='burger.jpg')
+        restaurant = Restaurant.objects.create(name='Ресторан')
+        restaurant.menu_items.create(product=self.product)
+
+    def get_products(self, **headers):
+        return self.client.get('/api/products/', **headers)
+
+    def read(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.get_products()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in json.loads(self.read(response))], ['Бургер'])
+
+        cached = self.get_products(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.read(cached), b'')
+
+    @override_settings(CATALOG_GZIP=True)
+    def test_gzip_follows_accept_encoding_quality(self):
+        for accept_encoding, compressed in [
+                ('gzip, deflate', True),
+                ('deflate, gzip;q=0.5', True),
+                ('gzip;q=0', False),
+                ('GZIP; q=0.0, *', False),
+                ('*;q=0.1', True),
+                ('identity', False),
+                ]:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get_products(HTTP_ACCEPT_ENCODING=accept_encoding)
+                body = self.read(response)
+                self.assertEqual(response.get('Content-Encoding') == 'gzip', compressed)
+                if compressed:
+                    body = gzip.decompress(body)
+                self.assertEqual([product['name'] for product in json.loads(body)], ['Бургер'])
+
+    def test_product_save_changes_etag(self):
+        etag = self.get_products()['ETag']
+
+        self.product.price = 120
+        self.product.save()
+
+        response = self.get_products(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(self.read(response))[0]['price'], '120.00')
+
+
+class MetricsTest(TestCase):
+    def get_metrics(self, **headers):
+        return self.client.get('/metrics', **headers)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_closed_without_configured_token(self):
+        self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_requires_bearer_token(self):
+        self.assertEqual(self.get_metrics().status_code, 403)
+        self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Basic secret').status_code, 403)
+        self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_allowed_ips_narrow_token_access(self):
+        self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Bearer secret').status_code, 403)
+        response = self.get_metrics(HTTP_AUTHORIZATION='Bearer secret', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_histograms_are_labelled_by_view(self):
+        self.client.get('/api/banners/')
+        with mock.patch.object(geocoder_client, 'get', return_value={
+                'response': {'GeoObjectCollection': {'featureMember': []}}}):
+            fetch_coordinates('key', 'Нигде')
+
+        body = self.get_metrics(HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        view = 'foodcartapp:foodcartapp.views.banners_list_api'
+        labels = f'view="{view}",method="GET",status="200"'
+        self.assertIn(f'starburger_request_duration_seconds_bucket{{{labels},le="+Inf"}}', body)
+        self.assertIn(f'starburger_request_sql_queries_count{{view="{view}"}}', body)
+        self.assertIn(f'starburger_request_geocoder_calls_bucket{{view="{view}",le="0"}}', body)
+        self.assertIn('starburger_geocoder_duration_seconds_count{outcome="not_found"}', body)
+        self.assertIn('# TYPE starburger_request_duration_seconds histogram', body)
+
+
+class AdminSearchTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        category = ProductCategory.objects.create(name='Burgers')
+        drinks = ProductCategory.objects.create(name='Drinks')
+        for name, product_category in [('Burger Deluxe', drinks), ('Cheeseburger', drinks), ('Cola', category)]:
+            Product.objects.create(name=name, price=100, category=product_category, image='product.jpg')
+        for name in ['Burger House', 'Star Burger']:
+            Restaurant.objects.create(name=name)
+
+    def autocomplete(self, model_name, term):
+        response = self.client.get(reverse(f'admin:foodcartapp_{model_name}_autocomplete'), {'term': term})
+        return sorted(result['text'] for result in response.json()['results'])
+
+    def search_changelist(self, model_name, term):
+        response = self.client.get(reverse(f'admin:foodcartapp_{model_name}_changelist'), {'q': term})
+        return sorted(str(obj) for obj in response.context['cl'].result_list)
+
+    def test_autocomplete_matches_prefix(self):
+        self.assertEqual(self.autocomplete('product', 'burger'), ['Burger Deluxe', 'Cola'])
+        self.assertEqual(self.autocomplete('restaurant', 'burger'), ['Burger House'])
+
+    def test_changelist_matches_substring(self):
+        self.assertEqual(self.search_changelist('product', 'burger'), ['Burger Deluxe', 'Cheeseburger', 'Cola'])
+        self.assertEqual(self.search_changelist('restaurant', 'burger'), ['Burger House', 'Star Burger'])
+
+
+class DistanceEngineTest(TestCase):
+    def setUp(self):
+        self.located = Place.objects.create(address='Абая, 10', lat=43.24, lng=76.92)
+        self.unknown = Place.objects.create(address='Нигде')
+        restaurant_place = Place.objects.create(address='Достык, 1', lat=43.25, lng=76.95)
+        self.restaurant = Restaurant.objects.create(name='Ресторан', place=restaurant_place)
+        self.unlocated_restaurant = Restaurant.objects.create(name='Без координат', place=self.unknown)
+
+    def get_rankings(self, engine, **options):
+        rankings = engine.rank([self.located, self.unknown, None], **options)
+        return [ranking if ranking is None else [restaurant for restaurant, km in ranking] for ranking in rankings]
+
+    def test_places_without_coordinates_are_not_ranked(self):
+        for engine_class in [DistanceEngine, RestaurantIndex]:
+            with self.subTest(engine=engine_class.__name__):
+                engine = engine_class([self.restaurant, self.unlocated_restaurant])
+                self.assertEqual(self.get_rankings(engine), [[self.restaurant], None, None])
+
+        index = RestaurantIndex([self.restaurant, self.unlocated_restaurant])
+        self.assertEqual(self.get_rankings(index, top_k=5), [[self.restaurant], None, None])
+
+    def test_places_without_coordinates_are_not_ranked_without_restaurants(self):
+        for restaurants in [[], [self.unlocated_restaurant]]:
+            for engine_class in [DistanceEngine, RestaurantIndex]:
+                with self.subTest(engine=engine_class.__name__, restaurants=len(restaurants)):
+                    engine = engine_class(restaurants)
+                    self.assertEqual(self.get_rankings(engine), [[], None, None])
+                    self.assertEqual(self.get_rankings(engine, top_k=5), [[], None, None])
@@ -1,19 +1,33 @@
+import hashlib
+import json
+import logging
+from collections import Counter
+
 import requests
-from django.db import transaction
-from django.http import JsonResponse
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.templatetags.static import static
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
 from environs import Env
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from .fetch_coordinates import fetch_coordinates
-from .models import Product, Order, OrderDetails, Place
+from .catalog import get_cached_catalog, get_catalog_meta, gzip_chunks, iter_and_cache_catalog, iter_catalog_json
+from .addresses import normalize_address
+from .geocache import get_or_create_place
+from .models import Order, OrderDetails, GeocodingTask, Place
+from .order_distances import store_order_distances
 from .serializers import OrderSerializer
 
 env = Env()
 env.read_env()
 
+logger = logging.getLogger(__name__)
+
 
 def banners_list_api(request):
     # FIXME move data to db?
@@ -39,71 +53,235 @@ def banners_list_api(request):
         })
 
 
+def accepts_gzip(request):
+    """Tell whether Accept-Encoding allows gzip, honouring q-values such as `gzip;q=0`."""
+    qualities = {}
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0)) > 0
+
+
+def get_catalog_variant(request):
+    pretty = request.GET.get('pretty') == '1'
+    compressed = settings.CATALOG_GZIP and accepts_gzip(request)
+    return pretty, compressed
+
+
+def get_catalog_etag(request):
+    pretty, compressed = get_catalog_variant(request)
+    etag = get_catalog_meta()['etag']
+    if pretty:
+        etag += '-pretty'
+    if compressed:
+        etag += '-gzip'
+    return etag
+
+
+@condition(etag_func=get_catalog_etag, last_modified_func=lambda request: get_catalog_meta()['last_modified'])
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-                },
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-                }
-            }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-        })
+    pretty, compressed = get_catalog_variant(request)
+    version = get_catalog_meta()['version']
+
+    body = None if pretty else get_cached_catalog(version, compressed)
+    if body is not None:
+        response = HttpResponse(body, content_type='application/json')
+    else:
+        if pretty:
+            chunks = iter_catalog_json(pretty=True)
+        else:
+            chunks = iter_and_cache_catalog(version)
+        if compressed:
+            chunks = gzip_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type='application/json')
+
+    if compressed:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def locate_order(address):
+    if settings.GEOCODE_ORDERS_ASYNC:
+        return None
+    try:
+        return get_or_create_place(env.str('GEO_API_KEY'), address)
+    except requests.exceptions.RequestException:
+        logger.exception('Не удалось получить координаты адреса %s', address)
+
+
+def get_known_places(addresses):
+    """Return the already geocoded places of the addresses by address, in one query."""
+    keys = {address: normalize_address(address) for address in addresses}
+    places = Place.objects.filter(address_key__in=keys.values(), lat__isnull=False, lng__isnull=False)
+    places_by_key = {place.address_key: place for place in places}
+    return {address: places_by_key.get(key) for address, key in keys.items()}
+
+
+def save_order_details(order, products):
+    lines = {}
+    for product_item in products:
+        product = product_item['product']
+        if product.id in lines:
+            lines[product.id]['quantity'] += product_item['quantity']
+        else:
+            lines[product.id] = {'product': product, 'quantity': product_item['quantity']}
+
+    OrderDetails.objects.bulk_create([
+        OrderDetails(order=order, product=line['product'], quantity=line['quantity'],
+                     product_price=line['product'].price * line['quantity'])
+        for line in lines.values()
+        ])
+
+
+def save_order(order_data, place):
+    order = Order.objects.create(
+        firstname=order_data['firstname'],
+        lastname=order_data['lastname'],
+        phonenumber=order_data['phonenumber'],
+        address=order_data['address'],
+        place=place,
+        idempotency_key=order_data.get('idempotency_key'),
+        idempotency_fingerprint=get_order_fingerprint(order_data) if order_data.get('idempotency_key') else '',
+        )
+    save_order_details(order, order_data['products'])
+    order.refresh_total_cost()
+
+    if place is None:
+        GeocodingTask.objects.update_or_create(
+            order=order,
+            defaults={
+                'address': order_data['address'],
+                'status': GeocodingTask.PENDING,
+                'attempts': 0,
+                'next_attempt_at': timezone.now(),
+                })
+    return order
+
+
+IDEMPOTENCY_KEY_MAX_LENGTH = Order._meta.get_field('idempotency_key').max_length
+
+
+def get_idempotency_key(request, order_data):
+    """Return the key from the Idempotency-Key header or the order body, if any."""
+    return request.META.get('HTTP_IDEMPOTENCY_KEY') or order_data.get('idempotency_key') or None
+
+
+def get_order_fingerprint(order_data):
+    """Return a digest of what the customer ordered, to tell a retry from another order under the same key."""
+    lines = Counter()
+    for product_item in order_data['products']:
+        lines[product_item['product'].id] += product_item['quantity']
+    payload = [
+        order_data['firstname'],
+        order_data['lastname'],
+        str(order_data['phonenumber']),
+        order_data['address'],
+        sorted(lines.items()),
+        ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode()).hexdigest()
+
+
+def is_same_order(order, order_data):
+    # Orders saved before fingerprints were stored can not be checked
+    return not order.idempotency_fingerprint or order.idempotency_fingerprint == get_order_fingerprint(order_data)
+
+
+def key_reused_response():
+    return Response(
+        {'idempotency_key': ['Ключ уже использован для другого заказа']},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
 
 
-@transaction.atomic()
 @api_view(['POST'])
 def register_order(request):
-    apikey = env.str('GEO_API_KEY')
-    place = None
     serializer = OrderSerializer(data=request.data)
-    if serializer.is_valid(raise_exception=True):
-        try:
-            lng, lat = fetch_coordinates(apikey=apikey, place=serializer.validated_data['address'])
-            place, is_created = Place.objects.get_or_create(
-                address=serializer.validated_data['address'],
-                defaults={'lat': lat, 'lng': lng})
-        except requests.exceptions.RequestException as e:
-            print(e)
-
-        order, is_created = Order.objects.update_or_create(
-            firstname=serializer.validated_data['firstname'],
-            lastname=serializer.validated_data['lastname'],
-            phonenumber=serializer.validated_data['phonenumber'],
-            address=serializer.validated_data['address'],
-            place=place
+    serializer.is_valid(raise_exception=True)
+    order_data = serializer.validated_data
+    order_data['idempotency_key'] = get_idempotency_key(request, order_data)
+    if order_data['idempotency_key'] and len(order_data['idempotency_key']) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return Response(
+            {'idempotency_key': [f'Ключ длиннее {IDEMPOTENCY_KEY_MAX_LENGTH} символов']},
+            status=status.HTTP_400_BAD_REQUEST,
+            )
+    if order_data['idempotency_key']:
+        order = Order.objects.filter(idempotency_key=order_data['idempotency_key']).first()
+        if order:
+            if not is_same_order(order, order_data):
+                return key_reused_response()
+            return Response(OrderSerializer(order).data, status.HTTP_200_OK)
+
+    place = locate_order(order_data['address'])
+    try:
+        with transaction.atomic():
+            order = save_order(order_data, place)
+            store_order_distances([order])
+    except IntegrityError:
+        # The same key was committed by a concurrent retry
+        order = Order.objects.filter(idempotency_key=order_data['idempotency_key']).first()
+        if not order_data['idempotency_key'] or order is None:
+            raise
+        if not is_same_order(order, order_data):
+            return key_reused_response()
+        return Response(OrderSerializer(order).data, status.HTTP_200_OK)
+    return Response(OrderSerializer(order).data, status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+def register_orders_batch(request):
+    if not isinstance(request.data, list) or len(request.data) > settings.ORDERS_BATCH_MAX_SIZE:
+        return Response(
+            {'detail': f'Ожидается список не более чем из {settings.ORDERS_BATCH_MAX_SIZE} заказов'},
+            status=status.HTTP_400_BAD_REQUEST,
+            )
+    serializer = OrderSerializer(data=request.data, many=True)
+    serializer.is_valid(raise_exception=True)
+
+    keys = [order_data.get('idempotency_key') for order_data in serializer.validated_data]
+    orders_by_key = Order.objects.in_bulk([key for key in keys if key], field_name='idempotency_key')
+    fingerprints = {key: order.idempotency_fingerprint for key, order in orders_by_key.items()}
+    new_orders_data = []
+    for order_data, key in zip(serializer.validated_data, keys):
+        if key:
+            fingerprint = get_order_fingerprint(order_data)
+            if fingerprints.setdefault(key, fingerprint) not in (fingerprint, ''):
+                return key_reused_response()
+        if key in orders_by_key:
+            continue
+        if key:
+            # A key repeated inside the batch creates one order
+            orders_by_key[key] = None
+        new_orders_data.append(order_data)
+
+    # A large batch must not wait for the geocoder, new addresses go to the geocoding queue
+    known_places = get_known_places({order_data['address'] for order_data in new_orders_data})
+    places = [known_places[order_data['address']] for order_data in new_orders_data]
+    try:
+        with transaction.atomic():
+            new_orders = [save_order(order_data, place) for order_data, place in zip(new_orders_data, places)]
+            store_order_distances(new_orders)
+    except IntegrityError:
+        return Response(
+            {'detail': 'Заказы с такими ключами уже оформляются, повторите запрос'},
+            status=status.HTTP_409_CONFLICT,
             )
 
-        for product_item in serializer.validated_data.get('products'):
-            order_details, is_created = OrderDetails.objects.get_or_create(
-                product=product_item['product'],
-                order=order,
-                defaults={
-                    'quantity': product_item['quantity'],
-                    'product_price': product_item['product'].price * product_item['quantity']
-                    })
-            if not is_created:
-                quantity = order_details.quantity + product_item['quantity']
-                product_price = order_details.product_price + product_item['product'].price * \
-                                product_item['quantity']
-                order_details.quantity = int(quantity)
-                order_details.product_price = product_price
-                order_details.save()
-        return Response(serializer.data, status.HTTP_201_CREATED)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    new_orders = iter(new_orders)
+    orders = []
+    for key in keys:
+        order = orders_by_key.get(key) or next(new_orders)
+        if key:
+            orders_by_key[key] = order
+        orders.append(order)
+    response_status = status.HTTP_201_CREATED if new_orders_data else status.HTTP_200_OK
+    return Response(OrderSerializer(orders, many=True).data, response_status)
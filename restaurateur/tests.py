@@ -1,3 +1,114 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from foodcartapp.models import Order, OrderDetails, Place, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from foodcartapp.order_distances import store_order_distances
+from restaurateur.views import encode_cursor
+
+
+class ViewOrdersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('manager', 'manager@example.com', 'password'))
+        category = ProductCategory.objects.create(name='Бургеры')
+        self.products = [
+            Product.objects.create(name=f'Бургер {number}', price=100, category=category, image='burger.jpg')
+            for number in range(3)
+            ]
+        for number in range(3):
+            place = Place.objects.create(address=f'Ресторан {number}', lat=43.2 + number / 100, lng=76.9)
+            restaurant = Restaurant.objects.create(name=f'Ресторан {number}', address=place.address, place=place)
+            for product in self.products:
+                RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+
+    def create_orders(self, count):
+        first_number = Order.objects.count()
+        for number in range(first_number, first_number + count):
+            place = Place.objects.create(address=f'Заказ {number}', lat=43.25, lng=76.95)
+            order = Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+77055197334',
+                                         address=place.address, place=place)
+            for product in self.products:
+                OrderDetails.objects.create(order=order, product=product, quantity=2, product_price=200)
+            order.refresh_total_cost()
+            store_order_distances([order])
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('restaurateur:view_orders'))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_depend_on_orders_count(self):
+        self.create_orders(1)
+        self.count_queries()
+        few_orders_queries = self.count_queries()
+
+        self.create_orders(20)
+        self.assertEqual(self.count_queries(), few_orders_queries)
+        self.assertLessEqual(few_orders_queries, 5)
+
+    def test_orders_show_cost_and_restaurants(self):
+        self.create_orders(1)
+        response = self.client.get(reverse('restaurateur:view_orders'))
+        self.assertContains(response, '600')
+        self.assertContains(response, 'Ресторан 0 - ')
+
+    @override_settings(ORDERS_PAGE_SIZE=2)
+    def test_orders_are_paginated_by_cursor(self):
+        self.create_orders(5)
+        Order.objects.filter(id=Order.objects.order_by('id').first().id).update(order_status=Order.PROCESSED)
+
+        seen_ids = []
+        url = reverse('restaurateur:view_orders')
+        while url:
+            response = self.client.get(url)
+            seen_ids.extend(order.id for order in response.context['order_items'])
+            next_page_query = response.context['next_page_query']
+            url = next_page_query and f"{reverse('restaurateur:view_orders')}?{next_page_query}"
+
+        unprocessed_ids = Order.objects.filter(order_status=Order.UNPROCESSED).order_by('-registered_at', '-id')
+        self.assertEqual(seen_ids, list(unprocessed_ids.values_list('id', flat=True)))
+
+    def poll_feed(self, since, seen=''):
+        response = self.client.get(reverse('restaurateur:orders_feed'), {'mode': 'poll', 'since': since, 'seen': seen})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    @override_settings(ORDERS_FEED_TIMEOUT=0)
+    def test_feed_delivers_orders_committed_after_later_changes(self):
+        since = encode_cursor(timezone.now() - timedelta(seconds=1), 0)
+        self.create_orders(1)
+        first_order = Order.objects.get()
+        feed = self.poll_feed(since)
+        self.assertEqual([order['id'] for order in feed['orders']], [first_order.id])
+
+        # A transaction that stamped its order earlier commits only now
+        self.create_orders(1)
+        late_order = Order.objects.latest('id')
+        Order.objects.filter(id=late_order.id).update(modified_at=first_order.modified_at - timedelta(seconds=1))
+        feed = self.poll_feed(feed['cursor'], feed['seen'])
+        self.assertEqual([order['id'] for order in feed['orders']], [late_order.id])
+        self.assertIn(f'data-sort-key="{encode_cursor(late_order.registered_at, late_order.id)}"',
+                      feed['orders'][0]['html'])
+
+        feed = self.poll_feed(feed['cursor'], feed['seen'])
+        self.assertEqual(feed['orders'], [])
+
+    @override_settings(ORDERS_FEED_TIMEOUT=0)
+    def test_distance_refresh_reaches_the_feed(self):
+        self.create_orders(1)
+        order = Order.objects.select_related('place').get()
+        since = encode_cursor(timezone.now(), 0)
+        Order.objects.filter(id=order.id).update(modified_at=timezone.now() - timedelta(days=1))
+
+        store_order_distances([order])
+
+        feed = self.poll_feed(since)
+        self.assertEqual([change['id'] for change in feed['orders']], [order.id])
@@ -1,12 +1,27 @@
+import json
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import user_passes_test
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.views import View
 
-from foodcartapp.models import Product, Restaurant, Order
+from foodcartapp.cache_versions import VersionedValue, get_version
+from foodcartapp.distances import format_ranking
+from foodcartapp.menu_index import get_menu_index
+from foodcartapp.models import Product, Restaurant, RestaurantMenuItem, Order, OrderDetails
+from foodcartapp.order_distances import get_order_rankings
 
 
 class Login(forms.Form):
@@ -61,27 +76,49 @@ def is_manager(user):
     return user.is_staff  # FIXME replace with specific permission
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+def get_availability_matrix():
+    """Return restaurants, product rows and a products x restaurants availability bitmap.
+
+    Each product row owns a slice of one bytearray with a byte per restaurant.
+    """
+    restaurants = list(Restaurant.objects.order_by('name').values('id', 'name'))
+    products = list(
+        Product.objects
+        .order_by('id')
+        .values('id', 'name', 'category__name', 'price', 'image')
+        )
+    columns = {restaurant['id']: column for column, restaurant in enumerate(restaurants)}
+    rows = {product['id']: row for row, product in enumerate(products)}
+
+    width = len(restaurants)
+    matrix = bytearray(len(products) * width)
+    menu_items = RestaurantMenuItem.objects.filter(availability=True).values_list('product_id', 'restaurant_id')
+    for product_id, restaurant_id in menu_items.iterator():
+        matrix[rows[product_id] * width + columns[restaurant_id]] = 1
 
-    default_availability = {restaurant.id: False for restaurant in restaurants}
+    image_storage = Product._meta.get_field('image').storage
     products_with_restaurants = []
-    for product in products:
-        availability = {
-            **default_availability,
-            **{item.restaurant_id: item.availability for item in product.menu_items.all()},
-            }
-        orderer_availability = [availability[restaurant.id] for restaurant in restaurants]
-
-        products_with_restaurants.append(
-            (product, orderer_availability)
-            )
+    for row, product in enumerate(products):
+        product['image_url'] = image_storage.url(product['image'])
+        products_with_restaurants.append((product, matrix[row * width:(row + 1) * width]))
+    return restaurants, products_with_restaurants
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_products(request):
+    versions = [get_version(name) for name in ('catalog', 'menu', 'restaurants')]
+    cache_key = f'products_table:{":".join(versions)}'
+    products_table = cache.get(cache_key)
+    if products_table is None:
+        restaurants, products_with_restaurants = get_availability_matrix()
+        products_table = render_to_string('products_table.html', context={
+            'products_with_restaurants': products_with_restaurants,
+            'restaurants': restaurants,
+            }, request=request)
+        cache.set(cache_key, products_table, settings.PRODUCTS_TABLE_CACHE_TTL)
 
     return render(request, template_name="products_list.html", context={
-        'products_with_restaurants': products_with_restaurants,
-        'restaurants': restaurants,
+        'products_table': products_table,
         })
 
 
@@ -92,9 +129,243 @@ def view_restaurants(request):
         })
 
 
+restaurant_choices = VersionedValue(
+    'restaurants',
+    lambda: list(Restaurant.objects.order_by('name').values_list('id', 'name')),
+    )
+
+
+class OrderFilter(forms.Form):
+    status = forms.ChoiceField(
+        label='Статус', required=False,
+        choices=[('', 'Все')] + Order.STATUS,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        )
+    payment_method = forms.ChoiceField(
+        label='Оплата', required=False,
+        choices=[('', 'Любая')] + Order.PAYMENT_METHOD,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        )
+    restaurant = forms.TypedChoiceField(
+        label='Ресторан', required=False, coerce=int, empty_value=None,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        )
+    cursor = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['restaurant'].choices = [('', 'Любой')] + restaurant_choices.get()
+
+    def clean_cursor(self):
+        cursor = self.cleaned_data['cursor']
+        if not cursor:
+            return None
+        try:
+            return decode_cursor(cursor)
+        except ValueError:
+            raise forms.ValidationError('Неверный курсор')
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+ORDER_COLUMNS = (
+    'id', 'registered_at', 'order_status', 'payment_method', 'total_cost',
+    'firstname', 'lastname', 'phonenumber', 'address',
+    'place__lat', 'place__lng',
+    )
+
+
+def encode_cursor(moment, order_id):
+    delta = moment - EPOCH
+    return f'{(delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds}_{order_id}'
+
+
+def decode_cursor(cursor):
+    microseconds, order_id = cursor.split('_')
+    return EPOCH + timedelta(microseconds=int(microseconds)), int(order_id)
+
+
+def get_order_filter(query):
+    order_filter = OrderFilter({'status': Order.UNPROCESSED, **query.dict()})
+    if not order_filter.is_valid():
+        order_filter = OrderFilter({'status': Order.UNPROCESSED})
+        order_filter.is_valid()
+    return order_filter
+
+
+def filter_orders(order_filter):
+    orders = Order.objects.all()
+    filters = order_filter.cleaned_data
+    if filters['status']:
+        orders = orders.filter(order_status=filters['status'])
+    if filters['payment_method']:
+        orders = orders.filter(payment_method=filters['payment_method'])
+    if filters['restaurant']:
+        orders = orders.filter(restaurant=filters['restaurant'])
+    return orders.select_related('place').only(*ORDER_COLUMNS)
+
+
+def get_orders_page(order_filter, page_size):
+    orders = filter_orders(order_filter)
+    if order_filter.cleaned_data['cursor']:
+        registered_at, order_id = order_filter.cleaned_data['cursor']
+        orders = orders.filter(
+            Q(registered_at__lt=registered_at) | Q(registered_at=registered_at, id__lt=order_id)
+            )
+
+    order_items = list(orders.order_by('-registered_at', '-id')[:page_size + 1])
+    next_cursor = None
+    if len(order_items) > page_size:
+        order_items = order_items[:page_size]
+        next_cursor = encode_cursor(order_items[-1].registered_at, order_items[-1].id)
+    return order_items, next_cursor
+
+
+def add_sort_keys(order_items):
+    """Give every order its position on the page, so the feed can insert new rows in place."""
+    for order in order_items:
+        order.sort_key = encode_cursor(order.registered_at, order.id)
+
+
+def add_restaurant_ranks(order_items):
+    order_products = defaultdict(list)
+    details = OrderDetails.objects.filter(order__in=order_items).values_list('order_id', 'product_id')
+    for order_id, product_id in details:
+        order_products[order_id].append(product_id)
+    menu_index = get_menu_index()
+    covering_restaurants = [
+        menu_index.restaurants_covering(order_products[order.id]) if order_products[order.id] else None
+        for order in order_items
+        ]
+
+    rankings = get_order_rankings(order_items, covering_restaurants, settings.NEAREST_RESTAURANTS_COUNT or None)
+    for order, ranking in zip(order_items, rankings):
+        order.rest_rang = format_ranking(ranking)
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
-    order_items = Order.objects.all().filter(order_status='UP').order_by('-id')
+    order_filter = get_order_filter(request.GET)
+    order_items, next_cursor = get_orders_page(order_filter, settings.ORDERS_PAGE_SIZE)
+    add_restaurant_ranks(order_items)
+    add_sort_keys(order_items)
+
+    next_page_query = None
+    if next_cursor:
+        query = request.GET.copy()
+        query['cursor'] = next_cursor
+        next_page_query = query.urlencode()
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
+
     return render(request, template_name='order_items.html', context={
-        'order_items': order_items
+        'order_items': order_items,
+        'order_filter': order_filter,
+        'next_page_query': next_page_query,
+        'first_page_query': filter_query.urlencode(),
+        'is_first_page': not order_filter.cleaned_data['cursor'],
+        'feed_cursor': encode_cursor(timezone.now(), 0),
+        'page_after': request.GET.get('cursor', '') if order_filter.cleaned_data['cursor'] else '',
+        'page_before': next_cursor or '',
         })
+
+
+def get_order_changes(request, order_filter, cursor, seen):
+    """Return rendered rows of orders changed after the cursor and the new cursor.
+
+    An order may commit with a modified_at older than the cursor, so orders
+    changed within ORDERS_FEED_OVERLAP seconds before the cursor are read
+    again. `seen` maps ids of orders already sent within that window to
+    their modified_at, it is updated in place so that each change goes once.
+    Rows of orders that no longer match the filter come with empty html,
+    so the page can drop them.
+    """
+    modified_at, order_id = cursor
+    window_start = modified_at - timedelta(seconds=settings.ORDERS_FEED_OVERLAP)
+    recent_changes = (
+        Order.objects
+        .filter(modified_at__gt=window_start)
+        .order_by('modified_at', 'id')
+        .values_list('id', 'modified_at')
+        )
+    changes = []
+    for change in recent_changes.iterator():
+        if seen.get(change[0]) != change[1]:
+            changes.append(change)
+            if len(changes) == settings.ORDERS_FEED_BATCH_SIZE:
+                break
+    if not changes:
+        return [], cursor
+
+    changed_ids = [order_id for order_id, modified_at in changes]
+    order_items = list(filter_orders(order_filter).filter(id__in=changed_ids))
+    add_restaurant_ranks(order_items)
+    add_sort_keys(order_items)
+    rows = {
+        order.id: render_to_string('order_row.html', {'item': order}, request=request)
+        for order in order_items
+        }
+    order_changes = [
+        {'id': order_id, 'version': encode_cursor(modified_at, order_id), 'html': rows.get(order_id, '')}
+        for order_id, modified_at in changes
+        ]
+
+    seen.update(changes)
+    cursor = max(cursor, (changes[-1][1], changes[-1][0]))
+    window_start = cursor[0] - timedelta(seconds=settings.ORDERS_FEED_OVERLAP)
+    for order_id, modified_at in list(seen.items()):
+        if modified_at <= window_start:
+            del seen[order_id]
+    return order_changes, cursor
+
+
+def encode_seen(seen):
+    return ','.join(encode_cursor(modified_at, order_id) for order_id, modified_at in seen.items())
+
+
+def decode_seen(value):
+    seen = {}
+    for item in filter(None, value.split(',')):
+        modified_at, order_id = decode_cursor(item)
+        seen[order_id] = modified_at
+    return seen
+
+
+def stream_order_changes(request, order_filter, cursor):
+    started_at = time.monotonic()
+    seen = {}
+    yield f'retry: {settings.ORDERS_FEED_POLL_INTERVAL * 1000}\n\n'
+    while time.monotonic() - started_at < settings.ORDERS_FEED_TIMEOUT:
+        order_changes, cursor = get_order_changes(request, order_filter, cursor, seen)
+        if order_changes:
+            yield f'id: {encode_cursor(*cursor)}\nevent: orders\ndata: {json.dumps(order_changes)}\n\n'
+            continue
+        yield ': ping\n\n'
+        time.sleep(settings.ORDERS_FEED_POLL_INTERVAL)
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def orders_feed(request):
+    order_filter = get_order_filter(request.GET)
+    try:
+        cursor = decode_cursor(request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since', ''))
+        seen = decode_seen(request.GET.get('seen', ''))
+    except ValueError:
+        return HttpResponseBadRequest('Неверный курсор')
+
+    if request.GET.get('mode') != 'poll':
+        response = StreamingHttpResponse(
+            stream_order_changes(request, order_filter, cursor),
+            content_type='text/event-stream',
+            )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    started_at = time.monotonic()
+    while True:
+        order_changes, cursor = get_order_changes(request, order_filter, cursor, seen)
+        if order_changes or time.monotonic() - started_at >= settings.ORDERS_FEED_TIMEOUT:
+            break
+        time.sleep(settings.ORDERS_FEED_POLL_INTERVAL)
+    return JsonResponse({'cursor': encode_cursor(*cursor), 'seen': encode_seen(seen), 'orders': order_changes})
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
     ]
 
 MIDDLEWARE = [
+    'foodcartapp.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,6 +79,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'star_burger.wsgi.application'
 
+CACHES = {
+    'default': {
+        'BACKEND': env('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env('CACHE_LOCATION', ''),
+        }
+    }
+
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
@@ -122,3 +130,57 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "assets"),
     os.path.join(BASE_DIR, "bundles"),
     ]
+
+GEOCODE_CACHE_SIZE = env.int('GEOCODE_CACHE_SIZE', 4096)
+GEOCODE_CACHE_TTL = env.int('GEOCODE_CACHE_TTL', 30 * 24 * 60 * 60)
+GEOCODE_CACHE_NEGATIVE_TTL = env.int('GEOCODE_CACHE_NEGATIVE_TTL', 24 * 60 * 60)
+
+GEOCODE_ORDERS_ASYNC = env.bool('GEOCODE_ORDERS_ASYNC', False)
+GEOCODE_MAX_ATTEMPTS = env.int('GEOCODE_MAX_ATTEMPTS', 5)
+
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3.05)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 5)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+GEOCODER_BACKOFF = env.float('GEOCODER_BACKOFF', 0.3)
+GEOCODER_POOL_SIZE = env.int('GEOCODER_POOL_SIZE', 10)
+GEOCODER_BREAKER_THRESHOLD = env.int('GEOCODER_BREAKER_THRESHOLD', 5)
+GEOCODER_BREAKER_RESET_TIMEOUT = env.int('GEOCODER_BREAKER_RESET_TIMEOUT', 30)
+
+DISTANCE_EXACT_TOP_K = env.int('DISTANCE_EXACT_TOP_K', 0)
+NEAREST_RESTAURANTS_COUNT = env.int('NEAREST_RESTAURANTS_COUNT', 10)
+NEAREST_RESTAURANTS_RADIUS_KM = env.float('NEAREST_RESTAURANTS_RADIUS_KM', 0)
+ORDER_DISTANCES_COUNT = env.int('ORDER_DISTANCES_COUNT', 30)
+
+ORDERS_BATCH_MAX_SIZE = env.int('ORDERS_BATCH_MAX_SIZE', 500)
+
+CATALOG_CACHE_TTL = env.int('CATALOG_CACHE_TTL', 24 * 60 * 60)
+CATALOG_GZIP = env.bool('CATALOG_GZIP', True)
+
+ORDERS_PAGE_SIZE = env.int('ORDERS_PAGE_SIZE', 50)
+ORDERS_FEED_BATCH_SIZE = env.int('ORDERS_FEED_BATCH_SIZE', 100)
+ORDERS_FEED_POLL_INTERVAL = env.int('ORDERS_FEED_POLL_INTERVAL', 2)
+ORDERS_FEED_TIMEOUT = env.int('ORDERS_FEED_TIMEOUT', 25)
+ORDERS_FEED_OVERLAP = env.int('ORDERS_FEED_OVERLAP', 30)
+
+PRODUCTS_TABLE_CACHE_TTL = env.int('PRODUCTS_TABLE_CACHE_TTL', 24 * 60 * 60)
+
+ADMIN_EXACT_COUNT_THRESHOLD = env.int('ADMIN_EXACT_COUNT_THRESHOLD', 10000)
+
+METRICS_TOKEN = env.str('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', [])
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            },
+        },
+    'loggers': {
+        'foodcartapp': {
+            'handlers': ['console'],
+            'level': env.str('LOG_LEVEL', 'INFO'),
+            },
+        },
+    }
@@ -19,6 +19,7 @@ from django.contrib import admin
 from django.shortcuts import render
 from django.urls import path, include
 
+from foodcartapp.metrics import metrics_view
 from . import settings
 
 urlpatterns = [
@@ -27,6 +28,7 @@ urlpatterns = [
                   path('api/', include('foodcartapp.urls')),
                   path('manager/', include('restaurateur.urls')),
                   path('api-auth/', include('rest_framework.urls')),
+                  path('metrics', metrics_view, name='metrics'),
                   ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 if settings.DEBUG: